@@ -0,0 +1,258 @@
+from http.server import BaseHTTPRequestHandler
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from search import (RESULT_LIMIT, TIMING_ENABLED, RequestTimer, build_version, cache_key, execute, get_client,
+                    name_filter, page_rows, response_cache, run_search)
+
+# Queries per request, and the largest request body read
+MAX_QUERIES = 100
+MAX_BODY_BYTES = 64 * 1024
+
+def parse_queries(body):
+    """(name, episode, language) tuples of a request body. Raises ValueError saying what is wrong."""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise ValueError('Request body is not valid JSON')
+    queries = payload.get('queries') if isinstance(payload, dict) else None
+    if not isinstance(queries, list) or not queries:
+        raise ValueError('Expected a JSON object with a non-empty "queries" list')
+    if len(queries) > MAX_QUERIES:
+        raise ValueError(f'At most {MAX_QUERIES} queries per request')
+
+    parsed = []
+    for i, query in enumerate(queries):
+        if not isinstance(query, dict):
+            raise ValueError(f'queries[{i}] is not an object')
+        name = str(query.get('name') or '').strip()
+        if not name:
+            raise ValueError(f'queries[{i}]: missing name')
+        episode = query.get('episode')
+        ep_num = None
+        if episode not in (None, ''):
+            try:
+                ep_num = int(episode)
+            except (TypeError, ValueError):
+                raise ValueError(f'queries[{i}]: episode must be a number')
+        language = str(query.get('language') or '').strip().lower()
+        parsed.append((name, ep_num, language))
+    return parsed
+
+def file_matches(episode_number, is_pack, range_end, episode):
+    """run_search()'s subtitle file filter for one episode"""
+    if is_pack or episode_number == episode:
+        return True
+    return episode_number is not None and range_end is not None and episode_number <= episode <= range_end
+
+def search_episodes(name, language, episodes, timer):
+    """
+    run_search() first pages of one name and language for several episodes,
+    from two queries instead of two per episode: the name is matched once, the
+    top RESULT_LIMIT torrents of every episode come from one windowed query,
+    and the subtitle files of all of them from one more.
+    Returns {episode: (results, cursor of the next page or None)}.
+    """
+    episodes = sorted(set(episodes))
+    source, where, name_params, rank = name_filter(name)
+    # The same file filter as run_search, against the episode of the joined coverage row
+    file_filter = ('(sf.episode_number = ec.episode OR sf.is_pack = 1 OR '
+                   '(sf.episode_number <= ec.episode AND sf.range_end >= ec.episode))')
+    files_filter = '(sf.episode_number IN ({}) OR sf.is_pack = 1 OR (sf.episode_number <= ? AND sf.range_end >= ?))'
+    file_params = []
+    if language:
+        where += ' AND EXISTS (SELECT 1 FROM torrent_languages tl WHERE tl.torrent_id = t.id AND tl.language = ?)'
+        name_params = name_params + [language]
+        file_filter += ' AND (sf.language = ? OR sf.is_pack = 1)'
+        files_filter += ' AND (sf.language = ? OR sf.is_pack = 1)'
+        file_params.append(language)
+
+    marks = ', '.join('?' * len(episodes))
+    # Score the name matches once (bm25 cannot share a SELECT with a window
+    # function), then number each episode's matches in that order
+    query = f'''
+        WITH scored AS (
+            SELECT t.id, t.name, t.languages, t.episodes_available, t.total_size, {rank} AS rank
+            FROM {source}
+            WHERE {where}
+        ), matched AS (
+            SELECT *, ROW_NUMBER() OVER (ORDER BY rank, id) AS position FROM scored
+        ), covered AS (
+            SELECT DISTINCT ec.episode, m.id, m.position
+            FROM matched m CROSS JOIN episode_coverage ec
+            WHERE ec.torrent_id = m.id AND +ec.episode IN ({marks})
+                AND EXISTS (
+                    SELECT 1 FROM subtitle_files sf
+                    WHERE sf.torrent_id = m.id AND {file_filter})
+        ), ranked AS (
+            SELECT episode, id, ROW_NUMBER() OVER (PARTITION BY episode ORDER BY position) AS episode_position
+            FROM covered
+        )
+        SELECT r.episode, m.id, m.name, m.languages, m.episodes_available, m.total_size, m.rank, m.id
+        FROM ranked r JOIN matched m ON m.id = r.id
+        WHERE r.episode_position <= {RESULT_LIMIT + 1}
+        ORDER BY r.episode, r.episode_position
+    '''
+    with timer.phase('query'):
+        result = execute(query, (*name_params, *episodes, *file_params))
+
+    # One row past the first page tells whether an episode has a next one
+    rows_by_episode = {episode: [] for episode in episodes}
+    for row in result.rows:
+        rows_by_episode[row[0]].append(row[1:])
+    torrents_by_episode = {}
+    cursors = {}
+    for episode, rows in rows_by_episode.items():
+        torrents_by_episode[episode], cursors[episode] = page_rows(rows, RESULT_LIMIT)
+
+    files_by_torrent = {}
+    torrent_ids = sorted({torrent[0] for torrents in torrents_by_episode.values() for torrent in torrents})
+    if torrent_ids:
+        subs_query = f'''SELECT sf.torrent_id, sf.filename, sf.language, sf.size, sf.episode_number, sf.is_pack,
+                sf.download_url, sf.range_end
+            FROM subtitle_files sf
+            WHERE sf.torrent_id IN ({', '.join('?' * len(torrent_ids))}) AND {files_filter.format(marks)}
+            ORDER BY sf.torrent_id, sf.id'''
+        with timer.phase('query'):
+            subs_result = execute(subs_query, (*torrent_ids, *episodes, episodes[-1], episodes[0], *file_params))
+        for row in subs_result.rows:
+            files_by_torrent.setdefault(row[0], []).append(row)
+
+    results = {}
+    for episode, torrents in torrents_by_episode.items():
+        episode_results = []
+        for torrent_id, torrent_name, langs, eps_available, total_size, _, _ in torrents:
+            subtitle_files = [{
+                'filename': s[1], 'language': s[2], 'size': s[3],
+                'episode': s[4], 'is_pack': bool(s[5]), 'download_url': s[6]
+            } for s in files_by_torrent.get(torrent_id, ()) if file_matches(s[4], s[5], s[7], episode)]
+            if subtitle_files:
+                episode_results.append({
+                    'torrent_id': torrent_id, 'name': torrent_name,
+                    'languages': json.loads(langs) if langs else [],
+                    'episodes_available': json.loads(eps_available) if eps_available else [],
+                    'has_episode': True, 'total_size': total_size, 'subtitle_files': subtitle_files
+                })
+        results[episode] = (episode_results, cursors[episode])
+    return results
+
+def batch_search(queries, timer):
+    """
+    Yield (query, results, next page cursor) in request order. Cached
+    queries are answered from search.py's response cache; the episodes of one
+    name and language are looked up together the first time one of them is
+    needed.
+    """
+    with timer.phase('cache'):
+        version = build_version()
+    resolved = {}
+    episodes_by_title = {}
+    for name, ep_num, language in queries:
+        key = cache_key(name, ep_num, language)
+        if key in resolved:
+            continue
+        with timer.phase('cache'):
+            page = response_cache.get(key, version)
+        if page is not None:
+            resolved[key] = page
+        elif ep_num is not None:
+            episodes_by_title.setdefault((key[0], language), (name, set()))[1].add(ep_num)
+
+    for name, ep_num, language in queries:
+        key = cache_key(name, ep_num, language)
+        if key not in resolved:
+            if ep_num is None:
+                resolved[key] = run_search(name, None, language, timer)
+                response_cache.put(key, version, resolved[key])
+            else:
+                title_name, episodes = episodes_by_title.pop((key[0], language))
+                for episode, page in search_episodes(title_name, language, episodes, timer).items():
+                    episode_key = cache_key(title_name, episode, language)
+                    resolved[episode_key] = page
+                    response_cache.put(episode_key, version, page)
+        yield (name, ep_num, language), *resolved[key]
+
+class handler(BaseHTTPRequestHandler):
+    def send_error_json(self, status, message, timer):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if TIMING_ENABLED:
+            self.send_header('Server-Timing', timer.header())
+        self.end_headers()
+        self.wfile.write(json.dumps({'error': message}).encode())
+        if TIMING_ENABLED:
+            timer.log(path='/api/batch', status=status, error=message)
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Max-Age', '86400')
+        self.end_headers()
+
+    def do_POST(self):
+        timer = RequestTimer()
+        try:
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                # rfile.read(-1) would block until the client hangs up
+                self.send_error_json(400, 'Invalid Content-Length', timer)
+                return
+            if length > MAX_BODY_BYTES:
+                self.send_error_json(413, f'Request body larger than {MAX_BODY_BYTES} bytes', timer)
+                return
+            try:
+                queries = parse_queries(self.rfile.read(length))
+            except ValueError as e:
+                self.send_error_json(400, str(e), timer)
+                return
+
+            with timer.phase('connect'):
+                get_client()
+            results = batch_search(queries, timer)
+            # The first group is resolved before the headers go out, so a
+            # database failure still gets a proper 500
+            first = next(results)
+        except Exception as e:
+            self.send_error_json(500, str(e), timer)
+            return
+
+        # Groups are written as they are resolved; the body ends with the connection
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', 'no-store')
+        if TIMING_ENABLED:
+            # Later groups are resolved while the body streams, so those phases are only in the log line
+            self.send_header('Server-Timing', timer.header())
+        self.end_headers()
+        self.wfile.write(b'{"count":%d,"results":[' % len(queries))
+        sent = count = 0
+        group = first
+        try:
+            while group is not None:
+                (name, ep_num, language), group_results, next_cursor = group
+                with timer.phase('serialize'):
+                    piece = json.dumps({
+                        'query': {'name': name, 'episode': ep_num, 'language': language or None},
+                        'count': len(group_results), 'next_cursor': next_cursor, 'results': group_results
+                    }, separators=(',', ':')).encode()
+                self.wfile.write(b',' + piece if sent else piece)
+                sent += 1
+                count += len(group_results)
+                group = next(results, None)
+            self.wfile.write(b']}')
+            status = 200
+        except Exception as e:
+            # Too late for an error status; close the JSON with what went wrong
+            self.wfile.write(b'],"error":' + json.dumps(str(e)).encode() + b'}')
+            status = 500
+        if TIMING_ENABLED:
+            timer.log(path='/api/batch', status=status, queries=len(queries), sent=sent, count=count)
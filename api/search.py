@@ -1,94 +1,426 @@
 from http.server import BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
+from collections import OrderedDict
+from contextlib import contextmanager
+import asyncio
+import base64
+import hashlib
 import json
 import os
+import re
+import sys
+import time
+import threading
+
+# Set SEARCH_TIMING=1 to get a Server-Timing header and one JSON log line per request
+TIMING_ENABLED = os.getenv('SEARCH_TIMING', '').lower() in ('1', 'true', 'yes')
+# A client idle for longer than this is pinged before reuse
+CLIENT_IDLE_CHECK = 60
+
+# Response cache: entries per instance, seconds an entry lives, and how often
+# the build version is re-read from TURSO
+CACHE_ENTRIES = 1024
+CACHE_TTL = 300
+VERSION_CHECK = 30
+CACHE_CONTROL = 'public, max-age=60, s-maxage=300, stale-while-revalidate=600'
+# Results per page: the default, and the most a request may ask for
+RESULT_LIMIT = 50
+MAX_LIMIT = 200
+# Part of every ETag, bumped whenever the response layout changes
+RESPONSE_FORMAT = 2
+# Results serialized per write while a response streams out
+RESULTS_PER_WRITE = 10
+
+# LibsqlError codes for a failed connection rather than a failed statement
+CONNECTION_ERROR_CODES = ('SERVER_ERROR', 'CLIENT_CLOSED')
+
+# One TURSO client per warm serverless instance, created on first use
+_client = None
+_client_used = 0.0
+_client_lock = threading.Lock()
+
+def create_client():
+    from libsql_client import create_client_sync
+    return create_client_sync(
+        url=os.getenv('TURSO_DATABASE_URL').replace('libsql://', 'https://'),
+        auth_token=os.getenv('TURSO_AUTH_TOKEN')
+    )
+
+def reset_client():
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+def get_client():
+    """The shared client, reconnecting if it has gone stale while the instance was idle"""
+    global _client, _client_used
+    with _client_lock:
+        if _client is not None and time.monotonic() - _client_used > CLIENT_IDLE_CHECK:
+            try:
+                _client.execute('SELECT 1')
+            except Exception:
+                try:
+                    _client.close()
+                except Exception:
+                    pass
+                _client = None
+        if _client is None:
+            _client = create_client()
+        _client_used = time.monotonic()
+        return _client
+
+def is_connection_error(error):
+    """True if a fresh connection may succeed; SQL errors fail the same way every time"""
+    from libsql_client import LibsqlError
+    if isinstance(error, LibsqlError):
+        return error.code in CONNECTION_ERROR_CODES
+    from aiohttp import ClientError
+    return isinstance(error, (OSError, asyncio.TimeoutError, ClientError))
+
+def execute(query, params=()):
+    """Run a query on the shared client, reconnecting once if the connection failed"""
+    try:
+        return get_client().execute(query, params)
+    except Exception as e:
+        if not is_connection_error(e):
+            raise
+        reset_client()
+        return get_client().execute(query, params)
+
+class RequestTimer:
+    """Per-phase wall time of one request, reported when SEARCH_TIMING is set"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def header(self):
+        timings = [f'{name};dur={ms:.1f}' for name, ms in self.phases.items()]
+        timings.append(f'total;dur={(time.perf_counter() - self.started) * 1000:.1f}')
+        return ', '.join(timings)
+
+    def log(self, **fields):
+        fields['phases_ms'] = {name: round(ms, 1) for name, ms in self.phases.items()}
+        fields['total_ms'] = round((time.perf_counter() - self.started) * 1000, 1)
+        print(json.dumps(fields), file=sys.stderr, flush=True)
+
+TOKEN_SEPARATOR_RE = re.compile(r'[\s_.]+')
+
+def name_filter(name):
+    """FROM/WHERE/rank for a name search against the torrent_search trigram index.
+
+    Tokens of 3+ characters become an FTS5 query over torrent names and normalized
+    titles (trigram phrases match substrings); shorter tokens can't be looked up
+    in a trigram index and are checked with LIKE on the candidates instead.
+    Results are ordered by rank, then torrent ID; LIKE-only searches all rank the same.
+    """
+    tokens = [token for token in TOKEN_SEPARATOR_RE.split(name) if token]
+    terms = ['"' + token.replace('"', '""') + '"' for token in tokens if len(token) >= 3]
+    short = [token for token in tokens if len(token) < 3]
+    if not terms:
+        return 'torrents t', 't.name LIKE ?', [f'%{name}%'], '0.0'
+    where = ' AND '.join(['torrent_search MATCH ?'] + ['t.name LIKE ?'] * len(short))
+    params = [' AND '.join(terms)] + [f'%{token}%' for token in short]
+    return 'torrent_search s JOIN torrents t ON t.id = s.rowid', where, params, 'bm25(torrent_search, 1.0, 2.0)'
+
+def encode_cursor(rank, torrent_id):
+    """Opaque cursor for the page after the torrent with this rank and ID"""
+    return base64.urlsafe_b64encode(json.dumps([rank, torrent_id], separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """(rank, torrent id) of a cursor from encode_cursor. Raises ValueError if it isn't one."""
+    try:
+        rank, torrent_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(rank, (int, float)) or isinstance(rank, bool) or not isinstance(torrent_id, int):
+        raise ValueError('Invalid cursor')
+    return float(rank), torrent_id
+
+def page_rows(rows, limit):
+    """The first limit of up to limit + 1 rows ending in (rank, id), and the cursor of the next page or None"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1][-2], rows[-1][-1])
+
+class ResponseCache:
+    """Size-bounded LRU of search results with a TTL. Entries from another
+    database build are treated as misses"""
+
+    def __init__(self, max_entries=CACHE_ENTRIES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            stored, entry_version, results = entry
+            if entry_version != version or time.monotonic() - stored > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return results
+
+    def put(self, key, version, results):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), version, results)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+response_cache = ResponseCache()
+_build_version = None
+_build_version_checked = 0.0
+
+def build_version():
+    """Version of the last database build that changed data, re-read every VERSION_CHECK seconds"""
+    global _build_version, _build_version_checked
+    if _build_version is None or time.monotonic() - _build_version_checked > VERSION_CHECK:
+        try:
+            rows = execute("SELECT value FROM build_meta WHERE key = 'build_version'").rows
+        except Exception:
+            # Database not rebuilt since build_meta was added
+            rows = execute('SELECT MAX(build_timestamp) FROM torrents').rows
+        _build_version = str(rows[0][0]) if rows else ''
+        _build_version_checked = time.monotonic()
+    return _build_version
+
+def run_search(name, ep_num, language, timer, limit=RESULT_LIMIT, after=None):
+    """
+    One page of search results for a name, optional episode number and
+    optional language, straight from TURSO. Pages are keyset-paginated on
+    (rank, torrent id): after is the decoded cursor of the previous page.
+    Returns (results, cursor of the next page or None).
+    """
+    results = []
+    source, where, name_params, rank = name_filter(name)
+    # Subtitle files for the episode, either exactly or inside an episode range,
+    # and in the language when given. Packs bundle every attachment of the
+    # torrent, so they are always kept
+    file_filter = '(sf.episode_number = ? OR sf.is_pack = 1 OR (sf.episode_number <= ? AND sf.range_end >= ?))'
+    file_params = [ep_num, ep_num, ep_num]
+    if language:
+        # Correlated, so only name matches are probed, by primary key
+        where += ' AND EXISTS (SELECT 1 FROM torrent_languages tl WHERE tl.torrent_id = t.id AND tl.language = ?)'
+        name_params = name_params + [language]
+        file_filter += ' AND (sf.language = ? OR sf.is_pack = 1)'
+        file_params.append(language)
+    # One row past the page tells whether there is a next one
+    page = 'WHERE (rank, id) > (?, ?) ORDER BY rank, id LIMIT ?' if after else 'ORDER BY rank, id LIMIT ?'
+    page_params = (*(after or ()), limit + 1)
+    
+    if ep_num is not None:
+        query = f'''
+            SELECT id, name, languages, episodes_available, total_size, rank, id FROM (
+                SELECT t.id, t.name, t.languages, t.episodes_available, t.total_size, {rank} AS rank
+                FROM {source}
+                WHERE {where}
+                    AND EXISTS (SELECT 1 FROM episode_coverage ec WHERE ec.torrent_id = t.id AND ec.episode = ?)
+                    AND EXISTS (
+                        SELECT 1 FROM subtitle_files sf
+                        WHERE sf.torrent_id = t.id AND {file_filter})
+            )
+            {page}
+        '''
+        with timer.phase('query'):
+            result = execute(query, (*name_params, ep_num, *file_params, *page_params))
+        rows, next_cursor = page_rows(result.rows, limit)
+        
+        torrents = []
+        for t in rows:
+            torrent_id, torrent_name, langs, eps_available, total_size = t[:5]
+            eps_list = json.loads(eps_available) if eps_available else []
+            torrents.append((torrent_id, torrent_name, langs, eps_list, total_size))
+        
+        files_by_torrent = {}
+        if torrents:
+            marks = ', '.join('?' * len(torrents))
+            subs_query = f'''SELECT sf.torrent_id, sf.filename, sf.language, sf.size, sf.episode_number, sf.is_pack, sf.download_url
+                FROM subtitle_files sf WHERE sf.torrent_id IN ({marks}) AND {file_filter}
+                ORDER BY sf.torrent_id, sf.id'''
+            with timer.phase('query'):
+                subs_result = execute(subs_query, (*(t[0] for t in torrents), *file_params))
+            for s in subs_result.rows:
+                files_by_torrent.setdefault(s[0], []).append({
+                    'filename': s[1], 'language': s[2], 'size': s[3],
+                    'episode': s[4], 'is_pack': bool(s[5]), 'download_url': s[6]
+                })
+        
+        for torrent_id, torrent_name, langs, eps_list, total_size in torrents:
+            subtitle_files = files_by_torrent.get(torrent_id)
+            if subtitle_files:
+                results.append({
+                    'torrent_id': torrent_id, 'name': torrent_name,
+                    'languages': json.loads(langs) if langs else [],
+                    'episodes_available': eps_list, 'has_episode': True,
+                    'total_size': total_size, 'subtitle_files': subtitle_files
+                })
+    else:
+        query = f'''SELECT id, name, languages, episodes_available, total_size, rank, id FROM (
+                SELECT t.id, t.name, t.languages, t.episodes_available, t.total_size, {rank} AS rank
+                FROM {source} WHERE {where})
+            {page}'''
+        with timer.phase('query'):
+            result = execute(query, (*name_params, *page_params))
+        rows, next_cursor = page_rows(result.rows, limit)
+        
+        for t in rows:
+            results.append({
+                'torrent_id': t[0], 'name': t[1],
+                'languages': json.loads(t[2]) if t[2] else [],
+                'episodes_available': json.loads(t[3]) if t[3] else [],
+                'total_size': t[4]
+            })
+    return results, next_cursor
+
+def cache_key(name, ep_num, language, limit=RESULT_LIMIT, after=None):
+    """Response cache key: queries differing only in case and whitespace share results"""
+    return ' '.join(name.casefold().split()), ep_num, language, limit, after
+
+def response_etag(version, key, query):
+    """
+    Strong ETag of a response, known before the search runs: results only
+    change with the build version, and the echoed query fields are hashed
+    too, so equal tags mean identical bodies
+    """
+    return '"' + hashlib.sha1(json.dumps([RESPONSE_FORMAT, version, key, query]).encode()).hexdigest() + '"'
+
+def search(name, ep_num, language, timer, limit=RESULT_LIMIT, after=None):
+    """run_search() behind the response cache, keyed on the normalized query and page"""
+    key = cache_key(name, ep_num, language, limit, after)
+    with timer.phase('cache'):
+        version = build_version()
+        page = response_cache.get(key, version)
+    if page is None:
+        page = run_search(name, ep_num, language, timer, limit, after)
+        response_cache.put(key, version, page)
+    return page
+
+def parse_episode(value):
+    """Episode number from the episode parameter, or None. Raises ValueError if it isn't a number."""
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('episode must be a number')
+
+def parse_limit(value):
+    """Page size from the limit parameter. Raises ValueError if it isn't 1 to MAX_LIMIT."""
+    if not value:
+        return RESULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('limit must be a number')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {MAX_LIMIT}')
+    return limit
 
 class handler(BaseHTTPRequestHandler):
+    def send_error_json(self, status, message):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(json.dumps({'error': message}).encode())
+
+    def write_pieces(self, pieces):
+        """Write and clear buffered pieces of the body. Returns the bytes written."""
+        data = b''.join(pieces)
+        pieces.clear()
+        self.wfile.write(data)
+        return len(data)
+
     def do_GET(self):
+        timer = RequestTimer()
         try:
-            from libsql_client import create_client_sync
-            
             parsed = urlparse(self.path)
             params = parse_qs(parsed.query)
             
             name = params.get('name', [''])[0].strip()
             episode = params.get('episode', [''])[0].strip()
             language = params.get('language', [''])[0].strip()
+            cursor = params.get('cursor', [''])[0].strip()
             
             if not name:
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Missing required parameter: name'}).encode())
+                self.send_error_json(400, 'Missing required parameter: name')
+                return
+            try:
+                ep_num = parse_episode(episode)
+                limit = parse_limit(params.get('limit', [''])[0].strip())
+                after = decode_cursor(cursor) if cursor else None
+            except ValueError as e:
+                self.send_error_json(400, str(e))
                 return
             
-            client = create_client_sync(
-                url=os.getenv('TURSO_DATABASE_URL').replace('libsql://', 'https://'),
-                auth_token=os.getenv('TURSO_AUTH_TOKEN')
-            )
-            
-            results = []
+            with timer.phase('connect'):
+                get_client()
             
-            if episode:
-                ep_num = int(episode)
-                query = '''
-                    SELECT DISTINCT t.id, t.name, t.languages, t.episodes_available, t.total_size
-                    FROM torrents t
-                    JOIN subtitle_files sf ON t.id = sf.torrent_id
-                    WHERE t.name LIKE ? AND (sf.episode_number = ? OR sf.is_pack = 1)
-                    LIMIT 50
-                '''
-                result = client.execute(query, (f'%{name}%', ep_num))
-                
-                for t in result.rows:
-                    torrent_id, torrent_name, langs, eps_available, total_size = t
-                    eps_list = json.loads(eps_available) if eps_available else []
-                    has_episode = ep_num in eps_list
-                    
-                    subs_query = '''SELECT filename, language, size, episode_number, is_pack, download_url
-                        FROM subtitle_files WHERE torrent_id = ? AND (episode_number = ? OR is_pack = 1)'''
-                    subs_result = client.execute(subs_query, (torrent_id, ep_num))
-                    
-                    subtitle_files = [{
-                        'filename': s[0], 'language': s[1], 'size': s[2],
-                        'episode': s[3], 'is_pack': bool(s[4]), 'download_url': s[5]
-                    } for s in subs_result.rows]
-                    
-                    if subtitle_files:
-                        # Only include if torrent actually has the episode OR is a pack that contains it
-                        if has_episode or (any(sf['is_pack'] for sf in subtitle_files) and has_episode):
-                            results.append({
-                                'torrent_id': torrent_id, 'name': torrent_name,
-                                'languages': json.loads(langs) if langs else [],
-                                'episodes_available': eps_list, 'has_episode': has_episode,
-                                'total_size': total_size, 'subtitle_files': subtitle_files
-                            })
+            query = {'name': name, 'episode': episode or None, 'language': language or None}
+            with timer.phase('cache'):
+                etag = response_etag(build_version(), cache_key(name, ep_num, language.lower(), limit, after), query)
+            if_none_match = self.headers.get('If-None-Match', '')
+            if etag in if_none_match or if_none_match.strip() == '*':
+                # Same build, same query: the client's copy is current, no need to search
+                status, results = 304, []
             else:
-                query = 'SELECT id, name, languages, episodes_available, total_size FROM torrents WHERE name LIKE ? LIMIT 50'
-                result = client.execute(query, (f'%{name}%',))
-                
-                for t in result.rows:
-                    results.append({
-                        'torrent_id': t[0], 'name': t[1],
-                        'languages': json.loads(t[2]) if t[2] else [],
-                        'episodes_available': json.loads(t[3]) if t[3] else [],
-                        'total_size': t[4]
-                    })
+                status = 200
+                results, next_cursor = search(name, ep_num, language.lower(), timer, limit, after)
             
-            response = json.dumps({
-                'query': {'name': name, 'episode': episode or None, 'language': language or None},
-                'count': len(results), 'results': results
-            }, indent=2)
-            
-            self.send_response(200)
+            self.send_response(status)
             self.send_header('Content-Type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', CACHE_CONTROL)
+            if TIMING_ENABLED:
+                # The body streams out after this, so serialize is only in the log line
+                self.send_header('Server-Timing', timer.header())
             self.end_headers()
-            self.wfile.write(response.encode())
+            
+            sent = 0
+            if status == 200:
+                # Written result by result, so the body is never held whole
+                with timer.phase('serialize'):
+                    head = json.dumps({
+                        'query': query, 'count': len(results), 'limit': limit, 'next_cursor': next_cursor
+                    }, separators=(',', ':'))
+                    pieces = [(head[:-1] + ',"results":[').encode()]
+                    for i, result in enumerate(results):
+                        piece = json.dumps(result, separators=(',', ':')).encode()
+                        pieces.append(b',' + piece if i else piece)
+                        if len(pieces) >= RESULTS_PER_WRITE:
+                            sent += self.write_pieces(pieces)
+                    pieces.append(b']}')
+                    sent += self.write_pieces(pieces)
+            if TIMING_ENABLED:
+                timer.log(path='/api/search', status=status, name=name, episode=episode or None,
+                          count=len(results), bytes=sent)
             
         except Exception as e:
             self.send_response(500)
             self.send_header('Content-Type', 'application/json')
+            if TIMING_ENABLED:
+                self.send_header('Server-Timing', timer.header())
             self.end_headers()
             self.wfile.write(json.dumps({'error': str(e)}).encode())
+            if TIMING_ENABLED:
+                timer.log(path='/api/search', status=500, error=str(e))
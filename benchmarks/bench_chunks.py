@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# Chunk format benchmark - size and client parse time of the plain JSON
+# chunks against the columnar format and its compressed siblings
+
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from build_database import SubtitleFiles, TorrentTable, join_files, build_final_db
+from compact_chunks import CompactChunk, encode_chunk, compressed_payloads
+from bench_language import make_rows
+
+def make_chunk(torrents, files_per_torrent, seed=1):
+    """A chunk as PagesWriter sees it, built from synthetic dump rows"""
+    rng = random.Random(seed)
+    rows = []
+    subtitle_files = SubtitleFiles()
+    torrent_metadata = TorrentTable()
+    for file_id, (torrent_id, name, filename, langs) in enumerate(make_rows(torrents, files_per_torrent, seed), 1):
+        rows.append([str(file_id), str(torrent_id), '0', filename])
+        afids = [rng.randrange(1, 1 << 24) for _ in langs]
+        subtitle_files.add(file_id, afids, langs, [rng.randrange(10000, 2000000) for _ in langs], 0)
+        if torrent_id not in torrent_metadata:
+            torrent_metadata.add(torrent_id, name, rng.randrange(1 << 28, 1 << 34), rng.randrange(1, 30),
+                                 rng.randrange(0, 20000), 0)
+    joined, _ = join_files(rows, subtitle_files, torrent_metadata)
+    final_db = build_final_db(joined, {torrent_id: torrent_metadata.get(torrent_id) for torrent_id in joined})
+    return {tid: final_db[tid] for tid in sorted(final_db, key=int)}
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the columnar chunk format')
+    parser.add_argument('chunk', nargs='?', help='docs/subtitles_N.json to measure instead of a synthetic chunk')
+    parser.add_argument('--torrents', type=int, default=20000)
+    parser.add_argument('--files-per-torrent', type=int, default=6)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.chunk:
+        with open(args.chunk) as f:
+            chunk = json.load(f)
+    else:
+        chunk = make_chunk(args.torrents, args.files_per_torrent)
+
+    plain = json.dumps(chunk, separators=(',', ':')).encode()
+    compact = json.dumps(encode_chunk(chunk), separators=(',', ':')).encode()
+    reader = CompactChunk(json.loads(compact))
+    if json.dumps(dict(reader.items())) != json.dumps(chunk):
+        sys.exit("❌ Columnar chunk does not decode back to the original")
+    print(f"✅ {len(chunk):,} torrents decode back to the original chunk")
+
+    sizes = [('json', len(plain)), ('json.gz', len(gzip.compress(plain, compresslevel=9, mtime=0))),
+             ('columnar', len(compact))]
+    sizes += [('columnar' + suffix, len(payload)) for suffix, payload in compressed_payloads(compact)]
+    for label, size in sizes:
+        print(f"📊 {label:<14} {size / 1024:>10,.0f}KB ({len(plain) / size:.1f}x smaller than json)")
+
+    ids = list(chunk)
+    sample = random.Random(2).sample(ids, min(100, len(ids)))
+    json_parse = best_time(lambda: json.loads(plain), args.repeat)
+    compact_parse = best_time(lambda: CompactChunk(json.loads(compact)), args.repeat)
+    lookups = best_time(lambda: [reader[tid] for tid in sample], args.repeat)
+    print(f"📊 json parse:     {json_parse * 1000:>8.1f}ms")
+    print(f"📊 columnar parse: {compact_parse * 1000:>8.1f}ms ({json_parse / compact_parse:.1f}x)")
+    print(f"📊 lazy lookup:    {lookups / len(sample) * 1e6:>8.1f}µs per torrent")
+
+if __name__ == '__main__':
+    main()
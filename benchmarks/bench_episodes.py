@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# Episode extraction benchmark - checks the compiled engine against the
+# original per-call re.search implementation and reports filenames/sec
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from build_database import extract_episode_number
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'episode_corpus.txt')
+
+# Reference implementation, kept verbatim from before the compiled engine
+def legacy_extract_episode_number(filename):
+    """
+    Extract episode number from anime filename. Returns (episode, is_range, range_end, season, is_special)
+    Covers 100+ naming patterns for anime files.
+    """
+    fn = filename.replace('_', ' ')
+    
+    # Skip non-episode files
+    skip_patterns = [
+        r'\b(NCOP|NCED|OP\d*|ED\d*|PV\d*|CM\d*|Menu|Preview|Trailer|Promo|Clean)\b',
+        r'^(OST|Soundtrack|CD|Disc|Music)\b',
+        r'/(OST|Soundtrack|Scans?|BK|Jacket|CD|Extra|Bonus)/',
+        r'\.(jpg|jpeg|png|bmp|gif|txt|nfo|sfv|exe|bat|url|ico|ttf|otf|srt|ass|ssa|sub|idx)$',
+    ]
+    for skip in skip_patterns:
+        if re.search(skip, fn, re.IGNORECASE):
+            return None, False, None, None, False
+    
+    # Extract season
+    season = None
+    for pattern in [r'\bS(\d{1,2})E\d', r'\bS(\d{1,2})\s*[-–]\s*\d', r'\bSeason\s*(\d{1,2})', r'[\s\.]S(\d{1,2})[\s\.]']:
+        match = re.search(pattern, fn, re.IGNORECASE)
+        if match:
+            season = int(match.group(1))
+            break
+    
+    # Check for specials (SP01, OVA 3, etc.)
+    special_match = re.search(r'\b(SP|OVA|OAD|ONA|Special)\s*(\d{1,3})', fn, re.IGNORECASE)
+    if special_match:
+        return int(special_match.group(2)), False, None, season, True
+    
+    # RANGE PATTERNS
+    range_patterns = [
+        r'Episodes?\s*(\d{1,4})\s*[-–~to]+\s*(\d{1,4})',
+        r'Eps?\.?\s*(\d{1,4})\s*[-–~]+\s*(\d{1,4})',
+        r'E(\d{1,4})\s*[-–~]+\s*E?(\d{1,4})',
+        r'\((\d{1,4})\s*[-–~]+\s*(\d{1,4})\)',
+        r'\[(\d{1,4})\s*[-–~]+\s*(\d{1,4})\]',
+        r'[\s\-](\d{1,4})\s*[-–~]+\s*(\d{1,4})\s*[\[\(]',
+        r'[\s\-](\d{1,4})\s*[-–~]+\s*(\d{1,4})[\s\]\)]',
+        r'[\s\-](\d{1,4})\s*[-–~]+\s*(\d{1,4})$',
+    ]
+    for pattern in range_patterns:
+        match = re.search(pattern, fn, re.IGNORECASE)
+        if match:
+            start, end = int(match.group(1)), int(match.group(2))
+            if 1 <= start <= 999 and start < end <= 9999:
+                return start, True, end, season, False
+    
+    # SINGLE EPISODE PATTERNS (100+ variations)
+    # Single episode patterns
+    patterns = [
+        # Explicit markers (highest priority)
+        r'S\d{1,2}E(\d{1,4})',                              # S01E12
+        r'\bEpisodes?\s*(\d{1,4})\b',                       # Episode 12
+        r'\bEps?\.?\s*(\d{1,4})\b',                         # Ep 12, Ep.12
+        r'#(\d{1,4})\b',                                    # #12
+        r'(?<![A-Fa-f0-9])E(\d{1,4})(?![A-Fa-f0-9])',      # E12 (not hex)
+        # Leading digits (for files like "01 title.mkv", "07 sv13 720.mkv")
+        r'^0*(\d{1,2})\s+\w',                               # 01 title, 07 sv13
+        # Dash separators
+        r'[-–]\s*(\d{1,4})\s*[\[\(]',                       # - 12 [
+        r'[-–]\s*(\d{1,4})\s*v\d',                          # - 12v2
+        r'[-–]\s*(\d{1,4})\s*END',                          # - 12 END
+        r'[-–]\s*(\d{1,4})\.(?:mkv|mp4|avi)',               # - 12.mkv
+        r'[-–]\s*(\d{1,4})\s*$',                            # - 12 (end)
+        r'[-–]\s*(\d{1,4})\s+(?![x\d])',                    # - 12 space
+        r'[-–]\s*(\d{1,4})\s*\)',                           # - 12)
+        r'S\d{1,2}\s*[-–]\s*(\d{1,4})',                     # S2 - 05
+        # Positional
+        r'^(\d{1,4})\s*[-–]\s*\w',                          # 12 - Title
+        r'^(\d{1,4})\.(?:mkv|mp4|avi)$',                    # 12.mkv
+        r'/(\d{1,4})\.(?:mkv|mp4|avi)$',                    # folder/12.mkv
+        # Delimiters
+        r'[_ ](\d{1,4})[_ ][\[\(]',                         # _12_ or " 12 ["
+        r'\.(\d{1,4})\.(?![x\d])',                          # .12.
+        r'\s(\d{1,4})\.(?:mkv|mp4|avi)',                    # " 12.mkv"
+        # Brackets (not hex)
+        r'\[(\d{1,3})\](?![A-Fa-f0-9])',                    # [12]
+        # Title patterns
+        r'[a-z]\s+(\d{1,4})\s*[\[\(]',                      # "Title 12 ["
+        r'[a-z]\s+(\d{1,4})\.(?:mkv|mp4|avi)',              # "Title 12.mkv"
+        r'[a-z!?]\s+(\d{1,4})\s*$',                         # "Title 12"
+        # Zero-padded
+        r'[-–\s]0*(\d{1,4})[\s\[\(]',                       # - 001 [
+        # Japanese
+        r'第(\d{1,4})話',                                   # 第12話
+        r'(\d{1,4})話',                                     # 12話
+    ]
+    
+    for pattern in patterns:
+        match = re.search(pattern, fn, re.IGNORECASE)
+        if match:
+            try:
+                ep = int(match.group(1))
+            except:
+                continue
+            if ep < 0 or ep > 9999:
+                continue
+            # Skip years
+            if 1950 <= ep <= 2030:
+                continue
+            # Skip resolution numbers (with or without 'p')
+            if ep in {480, 720, 1080, 2160, 1920, 1280, 848, 800}:
+                continue
+            # Skip x264/x265 only if it's a codec marker (not episode)
+            if ep in {264, 265}:
+                if re.search(r'\bx' + str(ep) + r'\b', fn, re.I) and not re.search(r'[-–]\s*' + str(ep) + r'\s*[\[\(\s]', fn):
+                    continue
+            return ep, False, None, season, False
+    
+    return None, False, None, None, False
+
+def load_corpus(path=CORPUS):
+    with open(path, encoding='utf-8') as f:
+        return [line.rstrip('\n') for line in f if line.strip()]
+
+def measure(func, filenames, repeat, before=None):
+    best = float('inf')
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        for fn in filenames:
+            func(fn)
+        best = min(best, time.perf_counter() - start)
+    return len(filenames) / best
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark episode number extraction')
+    parser.add_argument('--corpus', default=CORPUS, help='One filename per line')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed passes, best one is reported')
+    parser.add_argument('--duplicates', type=int, default=4,
+                        help='How often each filename repeats in the warm-cache run')
+    args = parser.parse_args()
+
+    filenames = load_corpus(args.corpus)
+
+    mismatches = 0
+    for fn in filenames:
+        expected = legacy_extract_episode_number(fn)
+        got = extract_episode_number(fn)
+        if got != expected:
+            mismatches += 1
+            print(f"❌ {fn!r}: expected {expected}, got {got}")
+    if mismatches:
+        sys.exit(f"❌ {mismatches} of {len(filenames)} filenames differ from the reference implementation")
+    print(f"✅ {len(filenames)} filenames match the reference implementation")
+
+    repeated = filenames * args.duplicates
+    legacy = measure(legacy_extract_episode_number, filenames, args.repeat, before=re.purge)
+    cold = measure(extract_episode_number, filenames, args.repeat, before=extract_episode_number.cache_clear)
+    warm = measure(extract_episode_number, repeated, args.repeat, before=extract_episode_number.cache_clear)
+
+    print(f"📊 legacy:                {legacy:>12,.0f} filenames/sec")
+    print(f"📊 compiled (cold cache): {cold:>12,.0f} filenames/sec ({cold / legacy:.1f}x)")
+    print(f"📊 compiled (x{args.duplicates} repeats):  {warm:>12,.0f} filenames/sec ({warm / legacy:.1f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# Language detection micro-benchmark - per-torrent memoized detection with
+# compiled matchers against the original per-call substring loops
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from build_database import (ENGLISH_FANSUB_GROUPS, ENGLISH_TITLE_PATTERNS, DUAL_AUDIO_PATTERNS,
+                            detect_file_languages)
+from bench_episodes import load_corpus
+
+# Reference implementation, kept verbatim from before the compiled matchers
+def legacy_smart_language_detection(lang, torrent_name, filename=''):
+    if lang != 'und':
+        return lang
+    name_lower = torrent_name.lower()
+    file_lower = filename.lower()
+    
+    for group in ENGLISH_FANSUB_GROUPS:
+        if f'[{group.lower()}]' in name_lower or f'({group.lower()})' in name_lower:
+            return 'eng'
+    
+    for pattern in DUAL_AUDIO_PATTERNS:
+        if pattern in name_lower:
+            return 'und'
+    
+    for pattern in ENGLISH_TITLE_PATTERNS:
+        if pattern in name_lower or pattern in file_lower:
+            return 'eng'
+    
+    return 'und'
+
+OTHER_GROUPS = ['Judas', 'ASW', 'EMBER', 'DKB', 'Anime Time', 'Ohys-Raws', 'Leopard-Raws', 'LostYears']
+TITLES = ['Zankyou no Terror', 'Sousou no Frieren', 'One Piece', 'Spy x Family', 'Dungeon Meshi']
+SUFFIXES = ['', ' [1080p]', ' [BD 1080p FLAC]', ' (Batch)', ' [Dual Audio]', ' [English Dub]', ' WEBRip',
+            ' [Multi-Subs]', ' [HEVC x265]']
+LANGS = ['und', 'und', 'eng', 'jpn', 'por', 'spa']
+
+def make_rows(torrents, files_per_torrent, seed=1):
+    """Synthetic (torrent_id, torrent_name, filename, langs) rows, grouped by torrent like the files dump"""
+    rng = random.Random(seed)
+    filenames = load_corpus()
+    groups = sorted(ENGLISH_FANSUB_GROUPS) + OTHER_GROUPS * 4
+    rows = []
+    for torrent_id in range(1, torrents + 1):
+        bracket = '[{}]' if rng.random() < 0.8 else '({})'
+        name = bracket.format(rng.choice(groups)) + ' ' + rng.choice(TITLES) + rng.choice(SUFFIXES)
+        for _ in range(rng.randrange(1, files_per_torrent * 2)):
+            langs = [rng.choice(LANGS) for _ in range(rng.randrange(1, 4))]
+            rows.append((torrent_id, name, rng.choice(filenames), langs))
+    return rows
+
+def run_legacy(rows):
+    return [[legacy_smart_language_detection(lang, name, filename) for lang in langs]
+            for _, name, filename, langs in rows]
+
+def run_memoized(rows):
+    verdicts = {}
+    return [detect_file_languages(langs, torrent_id, name, filename, verdicts)
+            for torrent_id, name, filename, langs in rows]
+
+def best_time(func, rows, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark subtitle language detection')
+    parser.add_argument('--torrents', type=int, default=20000)
+    parser.add_argument('--files-per-torrent', type=int, default=6)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rows = make_rows(args.torrents, args.files_per_torrent)
+    if run_legacy(rows) != run_memoized(rows):
+        sys.exit("❌ Memoized detection differs from the reference implementation")
+    print(f"✅ {len(rows):,} files across {args.torrents:,} torrents match the reference implementation")
+
+    legacy = best_time(run_legacy, rows, args.repeat)
+    memoized = best_time(run_memoized, rows, args.repeat)
+    print(f"📊 legacy:   {len(rows) / legacy:>12,.0f} files/sec")
+    print(f"📊 memoized: {len(rows) / memoized:>12,.0f} files/sec ({legacy / memoized:.1f}x)")
+
+if __name__ == '__main__':
+    main()
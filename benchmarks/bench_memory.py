@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# Lookup memory benchmark - footprint of the array-backed attachment size,
+# subtitle file and torrent metadata tables against the original dicts,
+# loaded from the same synthetic dumps
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from build_database import stream_dump, load_attachment_sizes, load_subtitle_files, load_torrent_metadata
+from synthetic_dumps import write_dumps
+
+# Reference implementations, kept verbatim from before the array-backed tables
+def legacy_load_attachment_sizes(path):
+    attachment_sizes = {}
+    for parts in stream_dump(path, 'attachmentfiles'):
+        if len(parts) >= 4:
+            try:
+                afid = int(parts[0])
+                filesize = int(parts[2])
+                attachment_sizes[afid] = filesize
+            except:
+                continue
+    return attachment_sizes
+
+def legacy_load_subtitle_files(path, attachment_sizes):
+    subtitle_files = {}
+    for parts in stream_dump(path, 'attachments', maxsplit=1):
+        if len(parts) == 2:
+            try:
+                file_id = int(parts[0])
+                attachment_data = json.loads(parts[1])
+                afids, langs, sizes = [], [], []
+                for sub in attachment_data[1]:
+                    if sub and '_afid' in sub:
+                        afid = sub['_afid']
+                        afids.append(afid)
+                        langs.append(sub.get('lang', 'eng'))
+                        sizes.append(attachment_sizes.get(afid, 50000))
+                if afids:
+                    crc = zlib.crc32(json.dumps([afids, langs, sizes]).encode())
+                    subtitle_files[file_id] = {'afids': afids, 'languages': langs, 'sizes': sizes, 'crc': crc}
+            except:
+                continue
+    return subtitle_files
+
+def legacy_load_torrent_metadata(path):
+    torrent_metadata = {}
+    for parts in stream_dump(path, 'torrents'):
+        if len(parts) >= 28:
+            try:
+                torrent_id = int(parts[0])
+                name = parts[5] if len(parts) > 5 else "Unknown"
+                total_size = int(parts[10]) if len(parts) > 10 and parts[10].isdigit() else 0
+                torrent_files = int(parts[16]) if len(parts) > 16 and parts[16].isdigit() else 0
+                anidb_id = int(parts[29]) if len(parts) > 29 and parts[29].isdigit() else 0
+                crc = zlib.crc32(f'{name}\t{total_size}\t{torrent_files}\t{anidb_id}'.encode('utf-8', 'surrogatepass'))
+                torrent_metadata[torrent_id] = {
+                    'name': name, 'total_size': total_size,
+                    'torrent_files': torrent_files, 'anidb_id': anidb_id, 'crc': crc
+                }
+            except:
+                continue
+    return torrent_metadata
+
+def measure(load):
+    """(result, bytes still allocated, peak bytes while loading, seconds)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = load()
+    seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, seconds
+
+def check_same(sizes, subtitle_files, torrent_metadata, legacy_sizes, legacy_files, legacy_torrents):
+    if len(sizes) != len(legacy_sizes) or any(sizes.get(afid) != size for afid, size in legacy_sizes.items()):
+        return 'attachment sizes'
+    if len(subtitle_files) != len(legacy_files):
+        return 'subtitle files'
+    for file_id, data in legacy_files.items():
+        i = subtitle_files.find(file_id)
+        if subtitle_files.row(i) != (data['afids'], data['languages'], data['sizes']) or subtitle_files.crcs[i] != data['crc']:
+            return 'subtitle files'
+    if len(torrent_metadata) != len(legacy_torrents):
+        return 'torrent metadata'
+    for torrent_id, data in legacy_torrents.items():
+        info = torrent_metadata.get(torrent_id)
+        if (info.name, info.total_size, info.torrent_files, info.anidb_id) != \
+                (data['name'], data['total_size'], data['torrent_files'], data['anidb_id']) or \
+                torrent_metadata.crcs[torrent_metadata.find(torrent_id)] != data['crc']:
+            return 'torrent metadata'
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the memory footprint of the dump lookups')
+    parser.add_argument('--torrents', type=int, default=50000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {name: path for name, (path, _) in write_dumps(directory, args.torrents, compress=False).items()}
+        # The loaders print progress; keep the report readable
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            legacy_sizes, *legacy_sizes_stats = measure(lambda: legacy_load_attachment_sizes(paths['attachmentfiles']))
+            legacy_files, *legacy_files_stats = measure(lambda: legacy_load_subtitle_files(paths['attachments'], legacy_sizes))
+            legacy_torrents, *legacy_torrents_stats = measure(lambda: legacy_load_torrent_metadata(paths['torrents']))
+            sizes, *sizes_stats = measure(lambda: load_attachment_sizes(paths['attachmentfiles']))
+            (subtitle_files, _), *files_stats = measure(lambda: load_subtitle_files(paths['attachments'], sizes))
+            torrent_metadata, *torrents_stats = measure(lambda: load_torrent_metadata(paths['torrents']))
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    mismatch = check_same(sizes, subtitle_files, torrent_metadata, legacy_sizes, legacy_files, legacy_torrents)
+    if mismatch:
+        sys.exit(f"❌ Array-backed {mismatch} differ from the reference implementation")
+    print(f"✅ {len(sizes):,} attachment sizes, {len(subtitle_files):,} subtitle files and "
+          f"{len(torrent_metadata):,} torrents match the reference implementation")
+
+    total_legacy = total_compact = 0
+    for label, count, legacy, compact in [
+            ('attachment sizes', len(sizes), legacy_sizes_stats, sizes_stats),
+            ('subtitle files', len(subtitle_files), legacy_files_stats, files_stats),
+            ('torrent metadata', len(torrent_metadata), legacy_torrents_stats, torrents_stats)]:
+        total_legacy += legacy[0]
+        total_compact += compact[0]
+        print(f"📊 {label:<17} dict {legacy[0] / 2**20:>7.1f}MB ({legacy[0] / count:>5.0f}B/entry, {legacy[2]:.2f}s)  "
+              f"array {compact[0] / 2**20:>7.1f}MB ({compact[0] / count:>5.0f}B/entry, {compact[2]:.2f}s)  "
+              f"{legacy[0] / compact[0]:.1f}x smaller")
+    print(f"📊 total             dict {total_legacy / 2**20:>7.1f}MB  array {total_compact / 2**20:>7.1f}MB  "
+          f"{total_legacy / total_compact:.1f}x smaller")
+
+if __name__ == '__main__':
+    main()
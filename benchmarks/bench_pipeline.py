@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# End-to-end benchmark - generates synthetic dumps, runs every build stage in
+# its own process from the previous stage's checkpoint, with a local SQLite
+# file standing in for TURSO, then times api/search.py queries against it.
+# Reports wall/CPU time, throughput and peak RSS per stage and can compare
+# the run against an earlier report to flag regressions.
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+from build_database import BUILD_STAGES, DUMP_NAMES, StageStore, StagedBuild, download_and_process
+from synthetic_dumps import TITLES, write_dumps
+
+TURSO_FILE = 'turso.db'
+SEARCH_REPORT = 'search.json'
+# Exit code of a search run that could not reach the database client
+SEARCH_SKIPPED = 3
+# Which dump's rows each stage goes through; the output stages count torrents
+STAGE_ROWS = {'sizes': 'attachmentfiles', 'subtitles': 'attachments', 'metadata': 'torrents', 'join': 'files'}
+SEARCH_LANGUAGES = ['eng', 'spa', 'por', 'ger']
+# Episodes looked up per season, one by one and through api/batch.py
+SEASON_EPISODES = 24
+
+def count_rows(path):
+    rows = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            rows += block.count(b'\n')
+    return max(rows - 1, 0)
+
+def run_child(work_dir, mode_args, log_name):
+    """Run this script in a child process. Returns (exit code, wall seconds, CPU seconds, peak RSS MB)."""
+    env = dict(os.environ, TURSO_DATABASE_URL=os.path.join(work_dir, TURSO_FILE), PYTHONUNBUFFERED='1')
+    env.pop('TURSO_AUTH_TOKEN', None)
+    with open(os.path.join(work_dir, 'logs', log_name), 'w') as log:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), *mode_args, '--work-dir', work_dir],
+                                   cwd=work_dir, stdout=log, stderr=subprocess.STDOUT, env=env)
+        # wait4 gives this child's own rusage, join workers included
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, wall, usage.ru_utime + usage.ru_stime, usage.ru_maxrss / 1024
+
+def run_stage(stage, dumps_dir, workers):
+    """Child: one build stage, reading earlier stages from their checkpoints"""
+    if stage == 'fetch':
+        if download_and_process(base_url='file://' + os.path.abspath(dumps_dir), force=True,
+                                only_stage='fetch') == 'failed':
+            sys.exit(1)
+        return
+    store = StageStore()
+    StagedBuild(store, store.marker('fetch')['paths'], workers).run([stage])
+
+def make_queries(count, seed):
+    """(kind, name, episode, language) search queries in the shapes the API gets"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        title = rng.choice(TITLES)
+        words = [word for word in title.split() if len(word) >= 3] or [title]
+        queries.append(('name', rng.choice([title, rng.choice(words), ' '.join(words[:2])]), None, None))
+        queries.append(('name+episode', rng.choice(words), rng.randrange(1, 13), None))
+        queries.append(('name+language', title, None, rng.choice(SEARCH_LANGUAGES)))
+        queries.append(('all filters', rng.choice(words), rng.randrange(1, 13), rng.choice(SEARCH_LANGUAGES)))
+        queries.append(('short word', rng.choice(['Ko', 'x', 'No', 'Oshi Ko']), None, None))
+        queries.append(('no match', f'Nonexistent Show {rng.randrange(1000)}', None, None))
+    return queries
+
+def run_search_queries(work_dir, count, seed):
+    """Child: time api/search.py queries against the stage-built SQLite file"""
+    sys.path.insert(0, os.path.join(ROOT, 'api'))
+    os.environ['TURSO_DATABASE_URL'] = 'file:' + os.path.join(work_dir, TURSO_FILE)
+    import search
+    try:
+        search.get_client()
+    except ImportError as e:
+        print(f"⚠️ Search benchmark skipped, the API's database client is not installed ({e})")
+        sys.exit(SEARCH_SKIPPED)
+
+    timings = {}
+    for kind, name, episode, language in make_queries(count, seed):
+        start = time.perf_counter()
+        results, _ = search.run_search(name, episode, language, search.RequestTimer())
+        timings.setdefault(kind, []).append(((time.perf_counter() - start) * 1000, len(results)))
+
+    # Repeated queries answered from the response cache
+    cached = []
+    for kind, name, episode, language in make_queries(count, seed)[:count]:
+        search.search(name, episode, language, search.RequestTimer())
+        start = time.perf_counter()
+        results, _ = search.search(name, episode, language, search.RequestTimer())
+        cached.append(((time.perf_counter() - start) * 1000, len(results)))
+    timings['cached'] = cached
+
+    # A whole season per sample: episode by episode, or as one batch request
+    import batch
+    rng = random.Random(seed)
+    for _ in range(max(1, count // 5)):
+        title = rng.choice(TITLES)
+        language = rng.choice([''] + SEARCH_LANGUAGES)
+        season = [(title, episode, language) for episode in range(1, SEASON_EPISODES + 1)]
+        start = time.perf_counter()
+        results = sum(len(search.run_search(*query, search.RequestTimer())[0]) for query in season)
+        timings.setdefault('season, per episode', []).append(((time.perf_counter() - start) * 1000, results))
+        search.response_cache.entries.clear()
+        start = time.perf_counter()
+        results = sum(len(group) for _, group, _ in batch.batch_search(season, search.RequestTimer()))
+        timings.setdefault('season, batched', []).append(((time.perf_counter() - start) * 1000, results))
+
+    report = {}
+    for kind, samples in timings.items():
+        latencies = sorted(ms for ms, _ in samples)
+        report[kind] = {
+            'queries': len(samples),
+            'qps': round(len(samples) / (sum(latencies) / 1000), 1),
+            'p50_ms': round(statistics.median(latencies), 2),
+            # Nearest-rank percentile: with few samples it is the slowest one
+            'p95_ms': round(latencies[math.ceil(len(latencies) * 0.95) - 1], 2),
+            'results': round(sum(n for _, n in samples) / len(samples), 1),
+        }
+    with open(os.path.join(work_dir, SEARCH_REPORT), 'w') as f:
+        json.dump(report, f)
+
+def compare(report, baseline, tolerance):
+    """Regression messages against an earlier report"""
+    regressions = []
+    for stage, result in report['stages'].items():
+        old = baseline.get('stages', {}).get(stage)
+        if not old:
+            continue
+        if old.get('rows_per_sec') and result['rows_per_sec'] < old['rows_per_sec'] * (1 - tolerance):
+            regressions.append(f"{stage}: {result['rows_per_sec']:,.0f} rows/sec, was {old['rows_per_sec']:,.0f}")
+        if result['peak_rss_mb'] > old['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{stage}: peak RSS {result['peak_rss_mb']:.0f}MB, was {old['peak_rss_mb']:.0f}MB")
+    for kind, result in report.get('search', {}).items():
+        old = baseline.get('search', {}).get(kind)
+        if isinstance(result, dict) and isinstance(old, dict) and result['qps'] < old['qps'] * (1 - tolerance):
+            regressions.append(f"search {kind}: {result['qps']:,.1f} queries/sec, was {old['qps']:,.1f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every build stage and the search API on synthetic dumps')
+    parser.add_argument('--torrents', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=1, help='Join workers, as build_database.py --workers')
+    parser.add_argument('--dumps', help='Existing *-latest.txt.xz dumps to use instead of generating them')
+    parser.add_argument('--work-dir', help='Where to build (kept afterwards); a temporary directory by default')
+    parser.add_argument('--queries', type=int, default=50, help='Search queries per query shape')
+    parser.add_argument('--output', help='Write the report as JSON to this file')
+    parser.add_argument('--baseline', help='Earlier JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Slowdown or memory growth against the baseline that counts as a regression')
+    parser.add_argument('--run-stage', choices=BUILD_STAGES, help=argparse.SUPPRESS)
+    parser.add_argument('--run-search', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        run_stage(args.run_stage, args.dumps, args.workers)
+        return
+    if args.run_search:
+        run_search_queries(args.work_dir, args.queries, args.seed)
+        return
+
+    work_dir = os.path.abspath(args.work_dir or tempfile.mkdtemp(prefix='bench_pipeline_'))
+    # Start from an empty build so a reused work dir does not turn into an incremental run
+    shutil.rmtree(os.path.join(work_dir, 'data'), ignore_errors=True)
+    for name in (TURSO_FILE, SEARCH_REPORT):
+        if os.path.exists(os.path.join(work_dir, name)):
+            os.remove(os.path.join(work_dir, name))
+    os.makedirs(os.path.join(work_dir, 'logs'), exist_ok=True)
+    report = {'torrents': args.torrents, 'seed': args.seed, 'workers': args.workers,
+              'python': platform.python_version(), 'started_at': int(time.time()), 'stages': {}}
+    try:
+        dumps_dir = args.dumps
+        if not dumps_dir:
+            dumps_dir = os.path.join(work_dir, 'upstream')
+            print(f"🔄 Generating {args.torrents:,} synthetic torrents...")
+            start = time.perf_counter()
+            write_dumps(dumps_dir, args.torrents, args.seed)
+            print(f"✅ Dumps generated in {time.perf_counter() - start:.1f}s")
+        dumps_dir = os.path.abspath(dumps_dir)
+
+        dump_rows = {}
+        for stage in BUILD_STAGES:
+            code, wall, cpu, rss = run_child(work_dir, ['--run-stage', stage, '--dumps', dumps_dir,
+                                                        '--workers', str(args.workers)], f'{stage}.log')
+            if code:
+                sys.exit(f"❌ Stage {stage} failed, see {os.path.join(work_dir, 'logs', stage + '.log')}")
+            store = StageStore(os.path.join(work_dir, StageStore().directory))
+            if stage == 'fetch':
+                dump_rows = {name: count_rows(os.path.join(work_dir, path))
+                             for name, path in store.marker('fetch')['paths'].items()}
+                rows = sum(dump_rows.values())
+            elif stage in STAGE_ROWS:
+                rows = dump_rows[STAGE_ROWS[stage]]
+            else:
+                rows = store.marker('pack')['torrents']
+            report['stages'][stage] = {'seconds': round(wall, 2), 'cpu_seconds': round(cpu, 2),
+                                       'peak_rss_mb': round(rss, 1), 'rows': rows,
+                                       'rows_per_sec': round(rows / wall, 1) if wall else 0.0}
+            print(f"📊 {stage:<10} {wall:>7.2f}s  cpu {cpu:>7.2f}s  {rows:>10,} rows  "
+                  f"{rows / wall if wall else 0:>11,.0f} rows/sec  peak RSS {rss:>7.1f}MB")
+        report['dumps'] = {name: dump_rows[name] for name in DUMP_NAMES}
+        total = sum(stage['seconds'] for stage in report['stages'].values())
+        print(f"✅ Built {report['stages']['pack']['rows']:,} torrents in {total:.1f}s")
+
+        code, wall, cpu, rss = run_child(work_dir, ['--run-search', '--queries', str(args.queries),
+                                                    '--seed', str(args.seed)], 'search.log')
+        if code == SEARCH_SKIPPED:
+            report['search'] = {'skipped': 'database client not installed'}
+            print("⚠️ Search benchmark skipped, the API's database client is not installed")
+        elif code:
+            sys.exit(f"❌ Search benchmark failed, see {os.path.join(work_dir, 'logs', 'search.log')}")
+        else:
+            with open(os.path.join(work_dir, SEARCH_REPORT)) as f:
+                report['search'] = json.load(f)
+            for kind, result in report['search'].items():
+                print(f"📊 search {kind:<20} {result['qps']:>9,.1f} queries/sec  p50 {result['p50_ms']:>7.2f}ms  "
+                      f"p95 {result['p95_ms']:>7.2f}ms  {result['results']:>5.1f} results")
+            print(f"📊 search peak RSS {rss:.1f}MB")
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"⚠️ Regression: {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+if __name__ == '__main__':
+    main()
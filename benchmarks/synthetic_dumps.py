@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# Synthetic AnimeTosho dumps - torrents/files/attachments/attachmentfiles in
+# the upstream column layout at any scale, with fansub-style release names and
+# attachment payloads, so the builder and the API can be measured without the
+# real multi-GB dumps. Output is deterministic for a given seed.
+
+import argparse
+import hashlib
+import json
+import lzma
+import os
+import random
+import time
+
+DUMP_NAMES = ('torrents', 'files', 'attachments', 'attachmentfiles')
+
+TITLES = [
+    'Sousou no Frieren', 'Kusuriya no Hitorigoto', 'Dungeon Meshi', 'Spy x Family', 'One Piece',
+    'Shingeki no Kyojin', 'Kimetsu no Yaiba', 'Jujutsu Kaisen', 'Chainsaw Man', 'Bocchi the Rock!',
+    'Oshi no Ko', 'Zankyou no Terror', 'Steins;Gate 0', 'Re:Zero kara Hajimeru Isekai Seikatsu',
+    'Kaguya-sama wa Kokurasetai', 'Mob Psycho 100', 'Vinland Saga', 'Hibike! Euphonium',
+    'Monogatari Series', 'Boku no Hero Academia', 'Mushoku Tensei', 'Made in Abyss', 'Dr. Stone',
+    'Tensei shitara Slime Datta Ken', 'Yuru Camp', 'Violet Evergarden', 'Cowboy Bebop',
+    'Fullmetal Alchemist Brotherhood', 'Hunter x Hunter (2011)', 'Shin Sekai Yori', 'Kaiju No. 8',
+    'Blue Lock', 'Tengoku Daimakyou', 'Odd Taxi', "JoJo's Bizarre Adventure", 'Ousama Ranking',
+]
+SEASON_SUFFIXES = ['', '', '', ' Season 2', ' 2nd Season', ' S3', ' (2024)', ' Final Season']
+SUB_GROUPS = ['SubsPlease', 'Erai-raws', 'HorribleSubs', 'Commie', 'FFF', 'UTW', 'gg', 'Asenshi', 'GJM',
+              'Coalgirls', 'Kametsu', 'Underwater', 'Judas', 'ASW', 'EMBER', 'DKB', 'Anime Time',
+              'LostYears', 'Yameii', 'Tsundere-Raws', 'MTBB', 'Cleo', 'Vodes', 'NanDesuKa']
+RAW_GROUPS = ['Ohys-Raws', 'Leopard-Raws', 'Moozzi2', 'Beatrice-Raws', 'ANK-Raws']
+SCENE_GROUPS = ['VARYG', 'Tsundere-Raws', 'ToonsHub', 'Kitsune', 'SMURF']
+RESOLUTIONS = ['1080p', '1080p', '1080p', '720p', '2160p', '1920x1080', 'BD 1080p', 'BD 1080p HEVC FLAC']
+TAGS = ['', '', '', ' [Dual Audio]', ' [Multi-Subs]', ' [HEVC x265]', ' (Batch)', ' [English Dub]',
+        ' [WEBRip]', ' [10bit]']
+WEB_SOURCES = ['CR', 'AMZN', 'NF', 'HIDIVE', 'DSNP', 'B-Global']
+# Track languages roughly as often as they show up upstream; 'und' is common
+# enough that the builder's language guessing gets a workout
+LANGUAGES = (['eng'] * 10 + ['und'] * 3 + ['por', 'spa', 'spa', 'ger', 'fre', 'ita', 'ara', 'rus',
+                                           'jpn', 'chi', 'ind', 'pol'])
+TRACK_NAMES = ['Full Subtitles', 'Signs & Songs', 'English', 'CR', 'Dialogue', 'Forced', '']
+FONTS = ['Arial.ttf', 'ArialBold.ttf', 'Trebuchet MS.ttf', 'GandhiSans-Bold.otf', 'Roboto-Medium.ttf',
+         'FOT-RodinNTLGPro-EB.otf', 'Oswald-Regular.ttf', 'LTFinnegan Medium.ttf', 'Vesta Pro.ttf',
+         'Noto Sans CJK JP.otf', 'Crimson Text.ttf', 'Dom Casual.ttf']
+EXTRAS = ['NCOP', 'NCOP2', 'NCED', 'NCED2', 'PV', 'Menu', 'Preview', 'CM01']
+EPISODE_COUNTS = [12, 12, 13, 24, 25, 26, 11, 10]
+
+TORRENT_FIELDS = ('id', 'tosho_id', 'nyaa_id', 'anidex_id', 'nyaa_subdom', 'name', 'link', 'magnet',
+                  'cat', 'website', 'totalsize', 'date_posted', 'comment', 'is_dupe', 'deleted', 'date_added',
+                  'num_files', 'btih', 'btih_sha256', 'torrentname', 'torrentfiles', 'stored_nzb',
+                  'total_size_nzb', 'nzb_sha1', 'date_updated', 'status', 'main_file', 'main_file_size',
+                  'aid', 'anidb_aid')
+FILE_FIELDS = ('id', 'torrent_id', 'filesize', 'filename', 'crc32', 'md5', 'sha1', 'type')
+ATTACHMENT_FIELDS = ('fid', 'data')
+ATTACHMENT_FILE_FIELDS = ('id', 'hash', 'filesize', 'packedsize', 'mime')
+
+def crc_tag(rng):
+    return f'{rng.randrange(1 << 32):08X}'
+
+def episode_label(rng, episode, total):
+    width = 3 if total >= 100 else 2
+    label = f'{episode:0{width}d}'
+    return label + ('v2' if rng.random() < 0.04 else '')
+
+class SeriesRelease:
+    """One release group's take on a title, naming its torrents and files consistently"""
+
+    def __init__(self, rng, title, anidb_id):
+        self.rng = rng
+        self.title = title
+        self.anidb_id = anidb_id
+        style = rng.random()
+        if style < 0.65:
+            self.style = 'fansub'
+            self.group = rng.choice(SUB_GROUPS)
+        elif style < 0.85:
+            self.style = 'scene'
+            self.group = rng.choice(SCENE_GROUPS)
+        else:
+            self.style = 'raw'
+            self.group = rng.choice(RAW_GROUPS)
+        self.resolution = rng.choice(RESOLUTIONS)
+        self.tag = rng.choice(TAGS)
+        self.season = 1 + (rng.random() < 0.3) * rng.randrange(1, 4)
+        self.episodes = rng.choice(EPISODE_COUNTS) if 'One Piece' not in title else 1100
+
+    def episode_file(self, episode, extension='mkv'):
+        rng = self.rng
+        label = episode_label(rng, episode, self.episodes)
+        if self.style == 'scene':
+            dotted = self.title.replace(' ', '.').replace(':', '').replace(';', '')
+            resolution = self.resolution.split()[-1] if self.resolution[0].isdigit() else '1080p'
+            return (f'{dotted}.S{self.season:02d}E{label}.{resolution}.{rng.choice(WEB_SOURCES)}.WEB-DL.'
+                    f'AAC2.0.H.264-{self.group}.{extension}')
+        shape = rng.random()
+        if shape < 0.7:
+            return f'[{self.group}] {self.title} - {label} ({self.resolution}) [{crc_tag(rng)}].{extension}'
+        if shape < 0.8:
+            return f'[{self.group}] {self.title} S{self.season:02d}E{label} [{self.resolution}].{extension}'
+        if shape < 0.87:
+            return f'[{self.group}] {self.title} - Episode {episode} [{self.resolution}].{extension}'
+        if shape < 0.93:
+            return f'[{self.group}] {self.title} 第{episode:02d}話 [{self.resolution}].{extension}'
+        return f'{label} {self.title}.{extension}'
+
+    def single(self):
+        """(torrent name, [filenames]) of a one-episode release"""
+        episode = self.rng.randrange(1, self.episodes + 1)
+        filename = self.episode_file(episode)
+        return filename.rsplit('.', 1)[0], [filename]
+
+    def batch(self):
+        """(torrent name, [filenames]) of a season batch with extras in a folder"""
+        rng = self.rng
+        first = 1 if self.episodes < 100 else rng.randrange(1, self.episodes - 24)
+        last = min(self.episodes, first + rng.choice([11, 12, 23, 25]) if self.episodes >= 100 else self.episodes)
+        if self.style == 'scene':
+            folder = f"{self.title.replace(' ', '.')}.S{self.season:02d}.1080p.WEB-DL.{self.group}"
+            name = folder
+        else:
+            folder = f'[{self.group}] {self.title} ({self.resolution})'
+            name = f'[{self.group}] {self.title} ({first:02d}-{last:02d}) [{self.resolution}]{self.tag}'
+            if rng.random() < 0.3:
+                name += ' (Batch)'
+        files = [f'{folder}/{self.episode_file(episode)}' for episode in range(first, last + 1)]
+        if self.style != 'scene' and rng.random() < 0.5:
+            for extra in rng.sample(EXTRAS, rng.randrange(1, 4)):
+                files.append(f'{folder}/Extras/[{self.group}] {self.title} - {extra} [{self.resolution}].mkv')
+        if rng.random() < 0.2:
+            files.append(f'{folder}/Specials/[{self.group}] {self.title} - OVA{rng.randrange(1, 3)} [{self.resolution}].mkv')
+        if rng.random() < 0.15:
+            files.append(f'[{self.group}] {self.title} {first:02d}-{last:02d} [Batch].mkv')
+        if rng.random() < 0.3:
+            files += [f'{folder}/Scans/{i:03d}.jpg' for i in range(1, rng.randrange(3, 12))]
+        return name, files
+
+    def movie_or_music(self):
+        rng = self.rng
+        if rng.random() < 0.5:
+            name = f'[{self.group}] {self.title} Movie [{self.resolution}]{self.tag}'
+            return name, [name + '.mkv']
+        name = f'{self.title} Original Soundtrack [FLAC]'
+        return name, [f'{self.title} OST/{i:02d} Track.flac' for i in range(1, rng.randrange(5, 25))] + [
+            f'{self.title} OST/cover.jpg']
+
+class DumpWriter:
+    """The four dump files, written row by row as TSV or as *-latest.txt.xz like upstream serves them"""
+
+    def __init__(self, directory, compress=True, preset=1):
+        os.makedirs(directory, exist_ok=True)
+        self.paths = {}
+        self.files = {}
+        self.rows = dict.fromkeys(DUMP_NAMES, 0)
+        headers = {'torrents': TORRENT_FIELDS, 'files': FILE_FIELDS, 'attachments': ATTACHMENT_FIELDS,
+                   'attachmentfiles': ATTACHMENT_FILE_FIELDS}
+        for name in DUMP_NAMES:
+            if compress:
+                path = os.path.join(directory, f'{name}-latest.txt.xz')
+                f = lzma.open(path, 'wt', encoding='utf-8', preset=preset)
+            else:
+                path = os.path.join(directory, f'{name}.tsv')
+                f = open(path, 'w', encoding='utf-8')
+            f.write('\t'.join(headers[name]) + '\n')
+            self.paths[name] = path
+            self.files[name] = f
+
+    def write(self, name, fields):
+        self.files[name].write('\t'.join(str(field) for field in fields) + '\n')
+        self.rows[name] += 1
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+def torrent_fields(rng, torrent_id, name, total_size, file_count, anidb_id, posted):
+    fields = [''] * len(TORRENT_FIELDS)
+    fields[0] = torrent_id
+    fields[1] = torrent_id + 400000
+    fields[2] = rng.randrange(1000000, 1900000)
+    fields[5] = name
+    fields[6] = f'https://nyaa.si/download/{fields[2]}.torrent'
+    fields[8] = 5
+    fields[10] = total_size
+    fields[11] = posted
+    fields[15] = posted + rng.randrange(60, 3600)
+    fields[16] = file_count
+    fields[17] = hashlib.sha1(f'{torrent_id}'.encode()).hexdigest()
+    fields[25] = 'complete'
+    fields[28] = anidb_id
+    fields[29] = anidb_id
+    return fields
+
+def write_dumps(directory, torrents, seed=1, compress=True, preset=1, malformed=0.002):
+    """
+    Generate torrents in ascending ID order, as the upstream dumps list them.
+    malformed is the share of rows written truncated or with junk IDs, which
+    the builder has to skip. Returns {dump name: (path, data rows)}.
+    """
+    rng = random.Random(seed)
+    titles = [title + suffix for title in TITLES for suffix in SEASON_SUFFIXES]
+    anidb_ids = {title: (rng.randrange(1, 19000) if rng.random() < 0.9 else 0) for title in titles}
+    releases = []
+    writer = DumpWriter(directory, compress, preset)
+    file_id = 0
+    afid = 0
+    fonts = {}
+    posted = 1262304000
+
+    try:
+        for torrent_id in range(1, torrents + 1):
+            # Groups keep releasing the same shows, so most torrents reuse a release
+            if not releases or rng.random() < 0.08:
+                title = rng.choice(titles)
+                releases.append(SeriesRelease(rng, title, anidb_ids[title]))
+            release = rng.choice(releases[-40:])
+            kind = rng.random()
+            if kind < 0.68:
+                name, filenames = release.single()
+            elif kind < 0.93:
+                name, filenames = release.batch()
+            else:
+                name, filenames = release.movie_or_music()
+            posted += rng.randrange(30, 900)
+
+            file_sizes = []
+            for filename in filenames:
+                file_id += 1
+                video = filename.endswith(('.mkv', '.mp4'))
+                size = rng.randrange(150 << 20, 1500 << 20) if video else rng.randrange(50 << 10, 40 << 20)
+                file_sizes.append(size)
+                if rng.random() < malformed:
+                    writer.write('files', [file_id, torrent_id])
+                    continue
+                writer.write('files', [file_id, torrent_id, size, filename, crc_tag(rng).lower(), '', '', 1])
+                if not filename.endswith('.mkv') or rng.random() < 0.12:
+                    continue
+
+                # Matroska attachments: fonts (shared between files, like the
+                # deduplicated upstream attachments) and subtitle tracks
+                font_entries = []
+                for font in rng.sample(FONTS, rng.randrange(0, 6)):
+                    if font not in fonts:
+                        afid += 1
+                        fonts[font] = afid
+                        writer.write('attachmentfiles', [afid, hashlib.md5(font.encode()).hexdigest(),
+                                                         rng.randrange(40 << 10, 12 << 20), 0, 'font/ttf'])
+                    font_entries.append({'_afid': fonts[font], 'name': font, 'mime': 'application/x-truetype-font'})
+                tracks = []
+                for trackno in range(rng.choices([1, 2, 3, 4, 6], [50, 25, 12, 8, 5])[0]):
+                    afid += 1
+                    subtitle_size = rng.randrange(4 << 10, 300 << 10)
+                    writer.write('attachmentfiles', [afid, f'{afid:032x}', subtitle_size, subtitle_size // 4,
+                                                     'text/x-ssa'])
+                    track = {'_afid': afid, 'trackno': trackno + 2, 'codec': rng.choice(['ASS', 'ASS', 'SRT', 'PGS']),
+                             'name': rng.choice(TRACK_NAMES), 'default': int(trackno == 0)}
+                    if rng.random() < 0.93:
+                        track['lang'] = rng.choice(LANGUAGES)
+                    tracks.append(track)
+                if rng.random() < 0.03:
+                    tracks.append(None)
+                if rng.random() < 0.02:
+                    tracks.append({'trackno': len(tracks) + 2, 'codec': 'ASS', 'error': 'extract failed'})
+                payload = json.dumps([font_entries, tracks], separators=(',', ':'), ensure_ascii=False)
+                if rng.random() < malformed:
+                    payload = payload[:len(payload) // 2]
+                writer.write('attachments', [file_id, payload])
+
+            fields = torrent_fields(rng, torrent_id, name, sum(file_sizes), len(filenames),
+                                    release.anidb_id, posted)
+            if rng.random() < malformed:
+                fields = fields[:12]
+            writer.write('torrents', fields)
+    finally:
+        writer.close()
+    return {name: (writer.paths[name], writer.rows[name]) for name in DUMP_NAMES}
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic AnimeTosho dumps')
+    parser.add_argument('directory', help='Output directory; serve it with build_database.py --base-url file://DIR')
+    parser.add_argument('--torrents', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--tsv', action='store_true', help='Write plain .tsv files instead of *-latest.txt.xz')
+    parser.add_argument('--preset', type=int, default=1, help='xz preset, higher is smaller and slower')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    dumps = write_dumps(args.directory, args.torrents, args.seed, not args.tsv, args.preset)
+    for name, (path, rows) in dumps.items():
+        print(f"📦 {name:<16} {rows:>12,} rows  {os.path.getsize(path) / 1024 / 1024:>8.1f}MB  {path}")
+    print(f"✅ Generated {args.torrents:,} torrents in {time.perf_counter() - start:.1f}s")
+
+if __name__ == '__main__':
+    main()
@@ -3,12 +3,36 @@
 
 import json
 import urllib.request
+import urllib.error
 import urllib.parse
 import lzma
 import sys
-from collections import defaultdict
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import accumulate
 import re
 import os
+import shutil
+import time
+import argparse
+import hashlib
+import zlib
+import pickle
+import platform
+import cProfile
+import pstats
+from array import array
+from bisect import bisect_left, bisect_right
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; the build report then leaves out worker CPU time and peak RSS
+    resource = None
+from compact_chunks import encode_chunk, compressed_payloads
 
 # [Keep all the existing functions and patterns from the original script]
 ENGLISH_FANSUB_GROUPS = {
@@ -37,184 +61,894 @@ DUAL_AUDIO_PATTERNS = {
     'dual language', 'bilingual', 'eng+jpn', 'jp+en'
 }
 
+# Episode extraction patterns, compiled once at import.
+# Every list is tried in order and the first acceptable match wins, so the
+# order below is the priority order and must not be rearranged.
+
+# Non-episode files; any hit means "no episode", so they share one regex
+EPISODE_SKIP_PATTERNS = [
+    r'\b(NCOP|NCED|OP\d*|ED\d*|PV\d*|CM\d*|Menu|Preview|Trailer|Promo|Clean)\b',
+    r'^(OST|Soundtrack|CD|Disc|Music)\b',
+    r'/(OST|Soundtrack|Scans?|BK|Jacket|CD|Extra|Bonus)/',
+    r'\.(jpg|jpeg|png|bmp|gif|txt|nfo|sfv|exe|bat|url|ico|ttf|otf|srt|ass|ssa|sub|idx)$',
+]
+
+SEASON_PATTERNS = [r'\bS(\d{1,2})E\d', r'\bS(\d{1,2})\s*[-–]\s*\d', r'\bSeason\s*(\d{1,2})', r'[\s\.]S(\d{1,2})[\s\.]']
+
+# Specials (SP01, OVA 3, etc.)
+SPECIAL_PATTERN = r'\b(SP|OVA|OAD|ONA|Special)\s*(\d{1,3})'
+
+RANGE_PATTERNS = [
+    r'Episodes?\s*(\d{1,4})\s*[-–~to]+\s*(\d{1,4})',
+    r'Eps?\.?\s*(\d{1,4})\s*[-–~]+\s*(\d{1,4})',
+    r'E(\d{1,4})\s*[-–~]+\s*E?(\d{1,4})',
+    r'\((\d{1,4})\s*[-–~]+\s*(\d{1,4})\)',
+    r'\[(\d{1,4})\s*[-–~]+\s*(\d{1,4})\]',
+    r'[\s\-](\d{1,4})\s*[-–~]+\s*(\d{1,4})\s*[\[\(]',
+    r'[\s\-](\d{1,4})\s*[-–~]+\s*(\d{1,4})[\s\]\)]',
+    r'[\s\-](\d{1,4})\s*[-–~]+\s*(\d{1,4})$',
+]
+
+# SINGLE EPISODE PATTERNS (100+ variations)
+EPISODE_PATTERNS = [
+    # Explicit markers (highest priority)
+    r'S\d{1,2}E(\d{1,4})',                              # S01E12
+    r'\bEpisodes?\s*(\d{1,4})\b',                       # Episode 12
+    r'\bEps?\.?\s*(\d{1,4})\b',                         # Ep 12, Ep.12
+    r'#(\d{1,4})\b',                                    # #12
+    r'(?<![A-Fa-f0-9])E(\d{1,4})(?![A-Fa-f0-9])',      # E12 (not hex)
+    # Leading digits (for files like "01 title.mkv", "07 sv13 720.mkv")
+    r'^0*(\d{1,2})\s+\w',                               # 01 title, 07 sv13
+    # Dash separators
+    r'[-–]\s*(\d{1,4})\s*[\[\(]',                       # - 12 [
+    r'[-–]\s*(\d{1,4})\s*v\d',                          # - 12v2
+    r'[-–]\s*(\d{1,4})\s*END',                          # - 12 END
+    r'[-–]\s*(\d{1,4})\.(?:mkv|mp4|avi)',               # - 12.mkv
+    r'[-–]\s*(\d{1,4})\s*$',                            # - 12 (end)
+    r'[-–]\s*(\d{1,4})\s+(?![x\d])',                    # - 12 space
+    r'[-–]\s*(\d{1,4})\s*\)',                           # - 12)
+    r'S\d{1,2}\s*[-–]\s*(\d{1,4})',                     # S2 - 05
+    # Positional
+    r'^(\d{1,4})\s*[-–]\s*\w',                          # 12 - Title
+    r'^(\d{1,4})\.(?:mkv|mp4|avi)$',                    # 12.mkv
+    r'/(\d{1,4})\.(?:mkv|mp4|avi)$',                    # folder/12.mkv
+    # Delimiters
+    r'[_ ](\d{1,4})[_ ][\[\(]',                         # _12_ or " 12 ["
+    r'\.(\d{1,4})\.(?![x\d])',                          # .12.
+    r'\s(\d{1,4})\.(?:mkv|mp4|avi)',                    # " 12.mkv"
+    # Brackets (not hex)
+    r'\[(\d{1,3})\](?![A-Fa-f0-9])',                    # [12]
+    # Title patterns
+    r'[a-z]\s+(\d{1,4})\s*[\[\(]',                      # "Title 12 ["
+    r'[a-z]\s+(\d{1,4})\.(?:mkv|mp4|avi)',              # "Title 12.mkv"
+    r'[a-z!?]\s+(\d{1,4})\s*$',                         # "Title 12"
+    # Zero-padded
+    r'[-–\s]0*(\d{1,4})[\s\[\(]',                       # - 001 [
+    # Japanese
+    r'第(\d{1,4})話',                                   # 第12話
+    r'(\d{1,4})話',                                     # 12話
+]
+
+# Numbers that look like episodes but are resolutions
+RESOLUTION_NUMBERS = frozenset({480, 720, 1080, 2160, 1920, 1280, 848, 800})
+
+_SKIP_RE = re.compile('|'.join(f'(?:{p})' for p in EPISODE_SKIP_PATTERNS), re.IGNORECASE)
+_SEASON_RES = [re.compile(p, re.IGNORECASE) for p in SEASON_PATTERNS]
+_SPECIAL_RE = re.compile(SPECIAL_PATTERN, re.IGNORECASE)
+_RANGE_RES = [re.compile(p, re.IGNORECASE) for p in RANGE_PATTERNS]
+_EPISODE_RES = [re.compile(p, re.IGNORECASE) for p in EPISODE_PATTERNS]
+# x264/x265 are skipped only when they are a codec marker, not "- 264 ["
+_CODEC_RES = {
+    ep: (re.compile(r'\bx' + str(ep) + r'\b', re.IGNORECASE), re.compile(r'[-–]\s*' + str(ep) + r'\s*[\[\(\s]'))
+    for ep in (264, 265)
+}
+_DIGIT_RE = re.compile(r'\d')
+
+NO_EPISODE = (None, False, None, None, False)
+
+@lru_cache(maxsize=1 << 16)
 def extract_episode_number(filename):
     """
     Extract episode number from anime filename. Returns (episode, is_range, range_end, season, is_special)
-    Covers 100+ naming patterns for anime files.
+    Covers 100+ naming patterns for anime files. Results are memoized per filename.
     """
     fn = filename.replace('_', ' ')
-    
-    # Skip non-episode files
-    skip_patterns = [
-        r'\b(NCOP|NCED|OP\d*|ED\d*|PV\d*|CM\d*|Menu|Preview|Trailer|Promo|Clean)\b',
-        r'^(OST|Soundtrack|CD|Disc|Music)\b',
-        r'/(OST|Soundtrack|Scans?|BK|Jacket|CD|Extra|Bonus)/',
-        r'\.(jpg|jpeg|png|bmp|gif|txt|nfo|sfv|exe|bat|url|ico|ttf|otf|srt|ass|ssa|sub|idx)$',
-    ]
-    for skip in skip_patterns:
-        if re.search(skip, fn, re.IGNORECASE):
-            return None, False, None, None, False
-    
-    # Extract season
+
+    # Every pattern past the skip list needs a digit
+    if not _DIGIT_RE.search(fn) or _SKIP_RE.search(fn):
+        return NO_EPISODE
+
     season = None
-    for pattern in [r'\bS(\d{1,2})E\d', r'\bS(\d{1,2})\s*[-–]\s*\d', r'\bSeason\s*(\d{1,2})', r'[\s\.]S(\d{1,2})[\s\.]']:
-        match = re.search(pattern, fn, re.IGNORECASE)
+    for regex in _SEASON_RES:
+        match = regex.search(fn)
         if match:
             season = int(match.group(1))
             break
-    
-    # Check for specials (SP01, OVA 3, etc.)
-    special_match = re.search(r'\b(SP|OVA|OAD|ONA|Special)\s*(\d{1,3})', fn, re.IGNORECASE)
+
+    special_match = _SPECIAL_RE.search(fn)
     if special_match:
         return int(special_match.group(2)), False, None, season, True
-    
-    # RANGE PATTERNS
-    range_patterns = [
-        r'Episodes?\s*(\d{1,4})\s*[-–~to]+\s*(\d{1,4})',
-        r'Eps?\.?\s*(\d{1,4})\s*[-–~]+\s*(\d{1,4})',
-        r'E(\d{1,4})\s*[-–~]+\s*E?(\d{1,4})',
-        r'\((\d{1,4})\s*[-–~]+\s*(\d{1,4})\)',
-        r'\[(\d{1,4})\s*[-–~]+\s*(\d{1,4})\]',
-        r'[\s\-](\d{1,4})\s*[-–~]+\s*(\d{1,4})\s*[\[\(]',
-        r'[\s\-](\d{1,4})\s*[-–~]+\s*(\d{1,4})[\s\]\)]',
-        r'[\s\-](\d{1,4})\s*[-–~]+\s*(\d{1,4})$',
-    ]
-    for pattern in range_patterns:
-        match = re.search(pattern, fn, re.IGNORECASE)
+
+    for regex in _RANGE_RES:
+        match = regex.search(fn)
         if match:
             start, end = int(match.group(1)), int(match.group(2))
             if 1 <= start <= 999 and start < end <= 9999:
                 return start, True, end, season, False
-    
-    # SINGLE EPISODE PATTERNS (100+ variations)
-    # Single episode patterns
-    patterns = [
-        # Explicit markers (highest priority)
-        r'S\d{1,2}E(\d{1,4})',                              # S01E12
-        r'\bEpisodes?\s*(\d{1,4})\b',                       # Episode 12
-        r'\bEps?\.?\s*(\d{1,4})\b',                         # Ep 12, Ep.12
-        r'#(\d{1,4})\b',                                    # #12
-        r'(?<![A-Fa-f0-9])E(\d{1,4})(?![A-Fa-f0-9])',      # E12 (not hex)
-        # Leading digits (for files like "01 title.mkv", "07 sv13 720.mkv")
-        r'^0*(\d{1,2})\s+\w',                               # 01 title, 07 sv13
-        # Dash separators
-        r'[-–]\s*(\d{1,4})\s*[\[\(]',                       # - 12 [
-        r'[-–]\s*(\d{1,4})\s*v\d',                          # - 12v2
-        r'[-–]\s*(\d{1,4})\s*END',                          # - 12 END
-        r'[-–]\s*(\d{1,4})\.(?:mkv|mp4|avi)',               # - 12.mkv
-        r'[-–]\s*(\d{1,4})\s*$',                            # - 12 (end)
-        r'[-–]\s*(\d{1,4})\s+(?![x\d])',                    # - 12 space
-        r'[-–]\s*(\d{1,4})\s*\)',                           # - 12)
-        r'S\d{1,2}\s*[-–]\s*(\d{1,4})',                     # S2 - 05
-        # Positional
-        r'^(\d{1,4})\s*[-–]\s*\w',                          # 12 - Title
-        r'^(\d{1,4})\.(?:mkv|mp4|avi)$',                    # 12.mkv
-        r'/(\d{1,4})\.(?:mkv|mp4|avi)$',                    # folder/12.mkv
-        # Delimiters
-        r'[_ ](\d{1,4})[_ ][\[\(]',                         # _12_ or " 12 ["
-        r'\.(\d{1,4})\.(?![x\d])',                          # .12.
-        r'\s(\d{1,4})\.(?:mkv|mp4|avi)',                    # " 12.mkv"
-        # Brackets (not hex)
-        r'\[(\d{1,3})\](?![A-Fa-f0-9])',                    # [12]
-        # Title patterns
-        r'[a-z]\s+(\d{1,4})\s*[\[\(]',                      # "Title 12 ["
-        r'[a-z]\s+(\d{1,4})\.(?:mkv|mp4|avi)',              # "Title 12.mkv"
-        r'[a-z!?]\s+(\d{1,4})\s*$',                         # "Title 12"
-        # Zero-padded
-        r'[-–\s]0*(\d{1,4})[\s\[\(]',                       # - 001 [
-        # Japanese
-        r'第(\d{1,4})話',                                   # 第12話
-        r'(\d{1,4})話',                                     # 12話
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, fn, re.IGNORECASE)
+
+    for regex in _EPISODE_RES:
+        match = regex.search(fn)
         if match:
             try:
                 ep = int(match.group(1))
-            except:
+            except ValueError:
                 continue
             if ep < 0 or ep > 9999:
                 continue
             # Skip years
             if 1950 <= ep <= 2030:
                 continue
-            # Skip resolution numbers (with or without 'p')
-            if ep in {480, 720, 1080, 2160, 1920, 1280, 848, 800}:
+            if ep in RESOLUTION_NUMBERS:
                 continue
-            # Skip x264/x265 only if it's a codec marker (not episode)
-            if ep in {264, 265}:
-                if re.search(r'\bx' + str(ep) + r'\b', fn, re.I) and not re.search(r'[-–]\s*' + str(ep) + r'\s*[\[\(\s]', fn):
+            if ep in _CODEC_RES:
+                codec_re, dash_re = _CODEC_RES[ep]
+                if codec_re.search(fn) and not dash_re.search(fn):
                     continue
             return ep, False, None, season, False
-    
-    return None, False, None, None, False
+
+    return NO_EPISODE
+
+def _substring_matcher(patterns):
+    """One alternation regex answering "does any of these substrings occur" in a single scan"""
+    return re.compile('|'.join(re.escape(p) for p in sorted(patterns, key=len, reverse=True)))
+
+_ENGLISH_GROUP_RE = _substring_matcher(
+    [f'[{group.lower()}]' for group in ENGLISH_FANSUB_GROUPS] +
+    [f'({group.lower()})' for group in ENGLISH_FANSUB_GROUPS]
+)
+_DUAL_AUDIO_RE = _substring_matcher(DUAL_AUDIO_PATTERNS)
+_ENGLISH_TITLE_RE = _substring_matcher(ENGLISH_TITLE_PATTERNS)
+
+def torrent_language_verdict(torrent_name):
+    """
+    Name-based answer for 'und' subtitles of a torrent: 'eng' or 'und' when the
+    torrent name decides it, None when the filename has to be checked too.
+    """
+    name_lower = torrent_name.lower()
+    if _ENGLISH_GROUP_RE.search(name_lower):
+        return 'eng'
+    if _DUAL_AUDIO_RE.search(name_lower):
+        return 'und'
+    if _ENGLISH_TITLE_RE.search(name_lower):
+        return 'eng'
+    return None
+
+def resolve_und_language(verdict, filename):
+    if verdict is not None:
+        return verdict
+    return 'eng' if _ENGLISH_TITLE_RE.search(filename.lower()) else 'und'
 
 def smart_language_detection(lang, torrent_name, filename=''):
     if lang != 'und':
         return lang
-    name_lower = torrent_name.lower()
-    file_lower = filename.lower()
-    
-    for group in ENGLISH_FANSUB_GROUPS:
-        if f'[{group.lower()}]' in name_lower or f'({group.lower()})' in name_lower:
-            return 'eng'
-    
-    for pattern in DUAL_AUDIO_PATTERNS:
-        if pattern in name_lower:
-            return 'und'
-    
-    for pattern in ENGLISH_TITLE_PATTERNS:
-        if pattern in name_lower or pattern in file_lower:
-            return 'eng'
-    
-    return 'und'
+    return resolve_und_language(torrent_language_verdict(torrent_name), filename)
 
-def download_and_process():
-    print("📥 Downloading AnimeTosho database...")
-    
-    files = {
-        'torrents': 'https://storage.animetosho.org/dbexport/torrents-latest.txt.xz',
-        'files': 'https://storage.animetosho.org/dbexport/files-latest.txt.xz',
-        'attachments': 'https://storage.animetosho.org/dbexport/attachments-latest.txt.xz',
-        'attachmentfiles': 'https://storage.animetosho.org/dbexport/attachmentfiles-latest.txt.xz'
+def detect_file_languages(langs, torrent_id, torrent_name, filename, verdicts):
+    """
+    smart_language_detection for every language of a file, with the torrent-level
+    verdict memoized in verdicts by torrent ID and the filename checked at most once
+    """
+    if 'und' not in langs:
+        return list(langs)
+    if torrent_id not in verdicts:
+        verdicts[torrent_id] = torrent_language_verdict(torrent_name)
+    und_lang = resolve_und_language(verdicts[torrent_id], filename)
+    return [und_lang if lang == 'und' else lang for lang in langs]
+
+DUMP_NAMES = ('torrents', 'files', 'attachments', 'attachmentfiles')
+DEFAULT_DUMP_BASE_URL = os.getenv('ANIMETOSHO_DUMP_URL', 'https://storage.animetosho.org/dbexport')
+
+# Bytes pulled from the HTTP body / dump files per read
+DUMP_READ_SIZE = 1 << 20
+DUMP_TIMEOUT = 120
+RETRY_DELAY = 5
+
+class DumpError(Exception):
+    pass
+
+# Running totals for the build report: rows and bytes read through
+# stream_dump per dump, and rows the loaders skipped because they would not
+# parse, keyed (dump, reason). BuildTelemetry reports each stage's share.
+dump_rows_read = Counter()
+dump_bytes_read = Counter()
+parse_failures = Counter()
+
+def count_parse_failure(dump, reason):
+    """Count a skipped row; reason is a short description or the exception it raised"""
+    parse_failures[dump, reason if isinstance(reason, str) else type(reason).__name__] += 1
+
+def dump_url(base_url, name):
+    return f"{base_url.rstrip('/')}/{name}-latest.txt.xz"
+
+def iter_decompressed(stream):
+    """Incrementally decompress an .xz byte stream, yielding decompressed blocks"""
+    decompressor = lzma.LZMADecompressor()
+    while True:
+        chunk = stream.read(DUMP_READ_SIZE)
+        if not chunk:
+            break
+        # Concatenated .xz streams: restart on whatever follows the previous one
+        if decompressor.eof:
+            chunk = decompressor.unused_data + chunk
+            decompressor = lzma.LZMADecompressor()
+        data = decompressor.decompress(chunk)
+        while decompressor.eof and decompressor.unused_data:
+            leftover = decompressor.unused_data
+            decompressor = lzma.LZMADecompressor()
+            data += decompressor.decompress(leftover)
+        if data:
+            yield data
+    if not decompressor.eof:
+        raise lzma.LZMAError("Compressed data ended before the end-of-stream marker was reached")
+
+def iter_lines(blocks):
+    """
+    Split a sequence of byte blocks into decoded lines.
+    Only one block plus one partial line is held in memory at a time.
+    """
+    pending = b''
+    for data in blocks:
+        lines = (pending + data).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            # splitlines() keeps the old behaviour for \r and unicode separators
+            yield from line.decode('utf-8', errors='ignore').splitlines()
+    if pending:
+        yield from pending.decode('utf-8', errors='ignore').splitlines()
+
+def iter_blocks(stream):
+    return iter(lambda: stream.read(DUMP_READ_SIZE), b'')
+
+def iter_tsv_rows(lines, maxsplit=-1):
+    """Yield the split TSV rows of a dump, skipping the header line"""
+    lines = iter(lines)
+    next(lines, None)
+    for line in lines:
+        yield line.strip().split('\t', maxsplit)
+
+def load_validators(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_validators(path, response):
+    validators = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified')
     }
-    
-    data = {}
-    for name, url in files.items():
+    with open(path, 'w') as f:
+        json.dump(validators, f)
+
+def decompress_dump(xz_path, tsv_path):
+    with open(xz_path, 'rb') as src, open(tsv_path + '.part', 'wb') as out:
+        for data in iter_decompressed(src):
+            out.write(data)
+    os.replace(tsv_path + '.part', tsv_path)
+
+def download_dump(url, xz_path):
+    """
+    Conditionally download a dump into the cache. Returns False on a 304.
+    A leftover .part file is resumed with a Range request, guarded by If-Range
+    so a dump that changed upstream in the meantime is fetched from scratch.
+    """
+    part_path = xz_path + '.part'
+    headers = {}
+    cached = load_validators(xz_path + '.json') if os.path.exists(xz_path) else {}
+    if cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    if cached.get('last_modified'):
+        headers['If-Modified-Since'] = cached['last_modified']
+
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    partial = load_validators(part_path + '.json') if offset else {}
+    if_range = partial.get('etag') or partial.get('last_modified')
+    if offset and if_range:
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = if_range
+
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        response = urllib.request.urlopen(request, timeout=DUMP_TIMEOUT)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return False
+        if e.code == 416:
+            # Stale partial file; the next attempt starts over
+            os.remove(part_path)
+        raise
+
+    with response:
+        if response.status == 206:
+            mode = 'ab'
+        else:
+            mode, offset = 'wb', 0
+            save_validators(part_path + '.json', response)
+        with open(part_path, mode) as out:
+            shutil.copyfileobj(response, out, DUMP_READ_SIZE)
+        # http.client does not raise on a short body, so check it here and
+        # keep the .part around for the next attempt to resume
+        expected = response.headers.get('Content-Length')
+        received = os.path.getsize(part_path) - offset
+        if expected and received < int(expected):
+            raise ConnectionError(f"Connection dropped after {received:,} of {int(expected):,} bytes")
+
+    os.replace(part_path, xz_path)
+    os.replace(part_path + '.json', xz_path + '.json')
+    return True
+
+def dump_cache_paths(cache_dir, name):
+    """(compressed, decompressed) paths of a cached dump"""
+    return os.path.join(cache_dir, f'{name}-latest.txt.xz'), os.path.join(cache_dir, f'{name}.tsv')
+
+def fetch_dump(name, base_url, cache_dir, retries=3):
+    """
+    Bring one cached dump up to date and make sure its decompressed TSV exists.
+    Returns (tsv_path, changed), where changed is False when upstream answered 304.
+    """
+    url = dump_url(base_url, name)
+    xz_path, tsv_path = dump_cache_paths(cache_dir, name)
+
+    for attempt in range(1, retries + 1):
         try:
-            with urllib.request.urlopen(url) as response:
-                compressed_data = response.read()
-            decompressed_data = lzma.decompress(compressed_data)
-            data[name] = decompressed_data.decode('utf-8', errors='ignore').splitlines()
-            print(f"✅ {name}: {len(data[name])} lines")
-        except Exception as e:
-            print(f"❌ Failed to download {name}: {e}")
+            changed = download_dump(url, xz_path)
+            if changed or not os.path.exists(tsv_path):
+                try:
+                    decompress_dump(xz_path, tsv_path)
+                except (EOFError, lzma.LZMAError):
+                    # Corrupt cache entry: drop it so the retry downloads it again
+                    for path in (xz_path, xz_path + '.json'):
+                        if os.path.exists(path):
+                            os.remove(path)
+                    raise
+            return tsv_path, changed
+        except (OSError, EOFError, lzma.LZMAError) as e:
+            if attempt == retries:
+                raise DumpError(f"Failed to download {name}: {e}") from e
+            print(f"⚠️ {name}: attempt {attempt}/{retries} failed ({e}), retrying...")
+            sys.stdout.flush()
+            time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+
+def fetch_dumps(base_url, cache_dir, workers=4, retries=3):
+    """
+    Refresh all cached dumps in parallel.
+    Returns (name -> TSV path, names of the dumps that changed upstream).
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    paths = {}
+    changed_dumps = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {name: pool.submit(fetch_dump, name, base_url, cache_dir, retries) for name in DUMP_NAMES}
+        for name, future in futures.items():
+            paths[name], changed = future.result()
+            if changed:
+                changed_dumps.append(name)
+            size_mb = os.path.getsize(paths[name]) / 1024 / 1024
+            status = 'updated' if changed else 'not modified'
+            print(f"📥 {name}: {status} ({size_mb:.1f}MB decompressed)")
+    return paths, changed_dumps
+
+def stream_dump(path, name, maxsplit=-1):
+    """Yield the parsed rows of a decompressed dump without loading it whole"""
+    rows = 0
+    with open(path, 'rb') as f:
+        try:
+            for parts in iter_tsv_rows(iter_lines(iter_blocks(f)), maxsplit):
+                rows += 1
+                yield parts
+        finally:
+            dump_rows_read[name] += rows
+            dump_bytes_read[name] += f.tell()
+    print(f"✅ {name}: {rows + 1} lines")
+
+def join_files(rows, subtitle_files, torrent_metadata):
+    """
+    Attach subtitle, language and episode info to file rows, grouped per torrent.
+    Per-torrent languages are kept as an insertion-ordered dict so shards
+    processed in different workers merge back in the same order.
+    """
+    torrents = {}
+    language_index = defaultdict(set)
+    verdicts = {}
+
+    for parts in rows:
+        # Rows that don't parse are counted once per build, by scan_file_changes
+        ids = file_row_ids(parts)
+        if ids is not None:
+            try:
+                file_id, torrent_id = ids
+                filename = parts[3]
+                
+                sub_row = subtitle_files.find(file_id)
+                metadata_row = torrent_metadata.find(torrent_id)
+                if sub_row >= 0 and metadata_row >= 0:
+                    if torrent_id not in torrents:
+                        torrents[torrent_id] = {'files': [], 'languages': {}, 'episodes': {}}
+                    
+                    afids, languages, sizes = subtitle_files.row(sub_row)
+                    
+                    processed_languages = detect_file_languages(
+                        languages, torrent_id, torrent_metadata.names[metadata_row], filename, verdicts)
+                    
+                    episode_num, is_range, range_end, season, is_special = extract_episode_number(filename)
+                    
+                    file_entry = {
+                        'filename': filename, 'afids': afids,
+                        'languages': processed_languages, 'sizes': sizes,
+                        'episode_number': episode_num, 'is_range': is_range,
+                        'range_end': range_end, 'season': season
+                    }
+                    
+                    torrents[torrent_id]['files'].append(file_entry)
+                    
+                    if episode_num:
+                        # Store episode (ranges stay as single entry with range_end info)
+                        torrents[torrent_id]['episodes'][episode_num] = file_entry
+                    
+                    for lang in processed_languages:
+                        torrents[torrent_id]['languages'][lang] = None
+                        language_index[lang].add(torrent_id)
+            except Exception as e:
+                count_parse_failure('files', e)
+                continue
+
+    return torrents, language_index
+
+def merge_joined(torrents, shard_torrents):
+    """Fold one shard's join output into the running result, preserving row order"""
+    for torrent_id, shard_data in shard_torrents.items():
+        if torrent_id not in torrents:
+            torrents[torrent_id] = shard_data
+            continue
+        torrent_data = torrents[torrent_id]
+        torrent_data['files'].extend(shard_data['files'])
+        torrent_data['languages'].update(shard_data['languages'])
+        torrent_data['episodes'].update(shard_data['episodes'])
+
+# Files rows joined at a time, in a worker or in-process
+SHARD_ROWS = 50000
+
+# Read-only lookups shared with forked join workers
+_join_lookups = None
+
+def _join_shard(rows):
+    """join_files in a worker, along with the parse failures it counted there"""
+    parse_failures.clear()
+    return join_files(rows, *_join_lookups), dict(parse_failures)
+
+def iter_shards(rows, size):
+    shard = []
+    for parts in rows:
+        shard.append(parts)
+        if len(shard) >= size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+def iter_joined_shards(rows, subtitle_files, torrent_metadata, workers=1):
+    """
+    join_files output per SHARD_ROWS rows, in row order. With several workers
+    the shards are joined on a process pool; the lookups are inherited by the
+    forked workers rather than pickled, and only a bounded number of shards is
+    in flight so the files dump is never held whole.
+    """
+    global _join_lookups
+    context = None
+    if workers > 1:
+        try:
+            context = multiprocessing.get_context('fork')
+        except ValueError:
+            print("⚠️ fork is not available on this platform, joining files in-process")
+    if context is None:
+        for shard in iter_shards(rows, SHARD_ROWS):
+            yield join_files(shard, subtitle_files, torrent_metadata)
+        return
+
+    _join_lookups = (subtitle_files, torrent_metadata)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            pending = deque()
+            for shard in iter_shards(rows, SHARD_ROWS):
+                pending.append(pool.submit(_join_shard, shard))
+                if len(pending) >= workers * 2:
+                    joined, failures = pending.popleft().result()
+                    parse_failures.update(failures)
+                    yield joined
+            while pending:
+                joined, failures = pending.popleft().result()
+                parse_failures.update(failures)
+                yield joined
+    finally:
+        _join_lookups = None
+
+# Joined torrents are spilled to disk in buckets of this many torrent IDs, so
+# a bucket never holds more torrents than a docs/ chunk
+SPILL_IDS = 50000
+# Records buffered in memory before they are appended to the bucket files
+SPILL_BUFFER = 20000
+
+class JoinSpill:
+    """
+    On-disk holding area between the join and the output stages. Shard results
+    are appended to per-ID-range bucket files together with the metadata the
+    output stage needs, so neither the joined torrents nor torrent_metadata
+    have to stay in memory; buckets are read back one at a time in ID order.
+    With clear=False an existing spill is reopened, e.g. by a resumed build.
+    """
+    def __init__(self, directory, clear=True):
+        self.directory = directory
+        if clear:
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+        self.buffers = defaultdict(list)
+        self.buffered = 0
+        self.seen = set()
+
+    def __len__(self):
+        return len(self.seen)
+
+    def bucket_path(self, bucket):
+        return os.path.join(self.directory, f'bucket_{bucket}.pickle')
+
+    def add_shard(self, shard_torrents, torrent_metadata):
+        for torrent_id, shard_data in shard_torrents.items():
+            metadata = None
+            if torrent_id not in self.seen:
+                self.seen.add(torrent_id)
+                metadata = torrent_metadata.get(torrent_id)
+            self.buffers[torrent_id // SPILL_IDS].append((torrent_id, shard_data, metadata))
+            self.buffered += 1
+        if self.buffered >= SPILL_BUFFER:
+            self.flush()
+
+    def flush(self):
+        for bucket, records in self.buffers.items():
+            with open(self.bucket_path(bucket), 'ab') as f:
+                pickle.dump(records, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.buffers.clear()
+        self.buffered = 0
+
+    def buckets(self):
+        self.flush()
+        return sorted(int(name[len('bucket_'):-len('.pickle')]) for name in os.listdir(self.directory))
+
+    def load(self, bucket):
+        """(joined torrents, torrent metadata) of one bucket, merged in row order"""
+        torrents = {}
+        metadata = {}
+        with open(self.bucket_path(bucket), 'rb') as f:
+            while True:
+                try:
+                    records = pickle.load(f)
+                except EOFError:
+                    break
+                for torrent_id, shard_data, torrent_metadata in records:
+                    merge_joined(torrents, {torrent_id: shard_data})
+                    if torrent_metadata is not None:
+                        metadata[torrent_id] = torrent_metadata
+        return torrents, metadata
+
+class IdTable:
+    """
+    Rows keyed by integer ID, one array per column, looked up by bisect on the
+    sorted ID array. Dumps list IDs in ascending order so sort() is normally
+    free; when an ID repeats the last row wins, as it would in a dict. Columns
+    with typecode None are plain lists, for values an array can't hold.
+    """
+    COLUMNS = ()
+
+    def __init__(self):
+        self.ids = array('q')
+        for name, typecode in self.COLUMNS:
+            setattr(self, name, [] if typecode is None else array(typecode))
+        self.sorted = True
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, row_id):
+        return self.find(row_id) >= 0
+
+    def add_id(self, row_id):
+        if self.ids and row_id <= self.ids[-1]:
+            self.sorted = False
+        self.ids.append(row_id)
+
+    def sort(self):
+        if self.sorted:
             return
+        ids = self.ids
+        order = sorted(range(len(ids)), key=ids.__getitem__)
+        order = [i for i, j in zip(order, order[1:] + [None]) if j is None or ids[i] != ids[j]]
+        self.ids = array('q', (ids[i] for i in order))
+        for name, typecode in self.COLUMNS:
+            column = getattr(self, name)
+            values = (column[i] for i in order)
+            setattr(self, name, list(values) if typecode is None else array(typecode, values))
+        self.sorted = True
+
+    def find(self, row_id):
+        i = bisect_left(self.ids, row_id)
+        return i if i < len(self.ids) and self.ids[i] == row_id else -1
+
+class DigestTable(IdTable):
+    """
+    id -> (crc32, owner id) rows, used to tell which dump rows changed since
+    the previous build
+    """
+    COLUMNS = (('crcs', 'I'), ('owners', 'q'))
+
+    def add(self, row_id, crc, owner=0):
+        self.add_id(row_id)
+        self.crcs.append(crc)
+        self.owners.append(owner)
+
+    def save(self, path):
+        self.sort()
+        with open(path, 'wb') as f:
+            array('q', [len(self.ids)]).tofile(f)
+            self.ids.tofile(f)
+            self.crcs.tofile(f)
+            self.owners.tofile(f)
+
+    @classmethod
+    def load(cls, path):
+        table = cls()
+        with open(path, 'rb') as f:
+            count = array('q')
+            count.fromfile(f, 1)
+            table.ids.fromfile(f, count[0])
+            table.crcs.fromfile(f, count[0])
+            table.owners.fromfile(f, count[0])
+        return table
+
+class BuildState:
+    """
+    What the previous build saw: dump ID watermarks, per-file and per-torrent
+    input digests and the docs/ chunk layout with content hashes.
+    """
+    MANIFEST = 'manifest.json'
+    FILES = 'file_digests.bin'
+    TORRENTS = 'torrent_digests.bin'
+
+    def __init__(self, manifest, files, torrents):
+        self.manifest = manifest
+        self.files = files
+        self.torrents = torrents
+
+    @property
+    def watermarks(self):
+        return self.manifest['watermarks']
+
+    @classmethod
+    def load(cls, state_dir):
+        """Previous state, or None when there is nothing usable to build on"""
+        try:
+            with open(os.path.join(state_dir, cls.MANIFEST)) as f:
+                manifest = json.load(f)
+            files = DigestTable.load(os.path.join(state_dir, cls.FILES))
+            torrents = DigestTable.load(os.path.join(state_dir, cls.TORRENTS))
+        except (OSError, ValueError, EOFError, KeyError):
+            return None
+        if manifest.get('chunk_size') != CHUNK_SIZE:
+            return None
+        for chunk in manifest['chunks']:
+            if not os.path.exists(chunk_path(chunk['id'])):
+                return None
+        if manifest.get('search_format') != SEARCH_FORMAT or not os.path.isdir(SEARCH_DIR):
+            return None
+        return cls(manifest, files, torrents)
+
+    def save(self, state_dir):
+        os.makedirs(state_dir, exist_ok=True)
+        self.files.save(os.path.join(state_dir, self.FILES))
+        self.torrents.save(os.path.join(state_dir, self.TORRENTS))
+        with open(os.path.join(state_dir, self.MANIFEST), 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+
+def file_row_ids(parts):
+    """(file_id, torrent_id) of a files row, or None if it would not parse in join_files"""
+    if len(parts) < 4:
+        return None
+    try:
+        return int(parts[0]), int(parts[1])
+    except ValueError:
+        return None
+
+def scan_file_changes(rows, subtitle_files, torrent_metadata, previous):
+    """
+    Digest every file row that will be joined and, given the previous build's
+    state, collect the torrents whose inputs are new, changed or gone.
+    Returns (files digests, torrent digests, max file id, dirty torrent IDs).
+    """
+    files = DigestTable()
+    torrents = DigestTable()
+    output_torrents = set()
+    dirty = set()
+    max_file_id = 0
+
+    if previous:
+        file_watermark = previous.watermarks['files']
+        torrent_watermark = previous.watermarks['torrents']
+        seen_files = bytearray(len(previous.files))
+        seen_torrents = bytearray(len(previous.torrents))
+
+    for parts in rows:
+        ids = file_row_ids(parts)
+        if ids is None:
+            count_parse_failure('files', 'short row' if len(parts) < 4 else 'bad id')
+            continue
+        file_id, torrent_id = ids
+        max_file_id = max(max_file_id, file_id)
+        sub_row = subtitle_files.find(file_id)
+        metadata_row = torrent_metadata.find(torrent_id)
+        if sub_row < 0 or metadata_row < 0:
+            continue
+
+        crc = zlib.crc32(parts[3].encode('utf-8', 'surrogatepass'), subtitle_files.crcs[sub_row])
+        files.add(file_id, crc, torrent_id)
+        new_torrent = torrent_id not in output_torrents
+        if new_torrent:
+            output_torrents.add(torrent_id)
+            torrents.add(torrent_id, torrent_metadata.crcs[metadata_row])
+
+        if not previous:
+            continue
+
+        # IDs past the watermarks are new by definition, skip the lookup
+        i = previous.files.find(file_id) if file_id <= file_watermark else -1
+        if i >= 0 and previous.files.crcs[i] == crc and previous.files.owners[i] == torrent_id:
+            seen_files[i] = 1
+        else:
+            dirty.add(torrent_id)
+
+        if new_torrent:
+            i = previous.torrents.find(torrent_id) if torrent_id <= torrent_watermark else -1
+            if i >= 0 and previous.torrents.crcs[i] == torrent_metadata.crcs[metadata_row]:
+                seen_torrents[i] = 1
+            else:
+                dirty.add(torrent_id)
+
+    if previous:
+        # Files and torrents that disappeared or changed take their old torrent with them
+        i = seen_files.find(0)
+        while i >= 0:
+            dirty.add(previous.files.owners[i])
+            i = seen_files.find(0, i + 1)
+        i = seen_torrents.find(0)
+        while i >= 0:
+            dirty.add(previous.torrents.ids[i])
+            i = seen_torrents.find(0, i + 1)
+
+    return files, torrents, max_file_id, dirty
+
+class AttachmentSizes(IdTable):
+    """afid -> file size"""
+    COLUMNS = (('sizes', 'q'),)
+
+    def add(self, afid, size):
+        self.add_id(afid)
+        self.sizes.append(size)
+
+    def get(self, afid, default=None):
+        i = self.find(afid)
+        return self.sizes[i] if i >= 0 else default
 
-    # Build attachment file size lookup
+class SubtitleFiles(IdTable):
+    """
+    file_id -> subtitle afids, languages and sizes. The per-file lists are
+    flattened into shared arrays addressed by each row's start and count, and
+    every language code is stored once and referenced by index.
+    """
+    COLUMNS = (('starts', 'q'), ('counts', 'I'), ('crcs', 'I'))
+
+    def __init__(self):
+        super().__init__()
+        self.afids = array('q')
+        self.sizes = array('q')
+        self.language_codes = array('H')
+        self.codes = []
+        self.code_index = {}
+
+    def add(self, file_id, afids, languages, sizes, crc):
+        codes = []
+        for language in languages:
+            code = self.code_index.get(language)
+            if code is None:
+                code = self.code_index[language] = len(self.codes)
+                self.codes.append(language)
+            codes.append(code)
+        # Convert before touching the table so a bad value can't leave a half-added row
+        afids, sizes = array('q', afids), array('q', sizes)
+        self.add_id(file_id)
+        self.starts.append(len(self.afids))
+        self.counts.append(len(afids))
+        self.crcs.append(crc)
+        self.afids.extend(afids)
+        self.sizes.extend(sizes)
+        self.language_codes.extend(codes)
+
+    def row(self, i):
+        """(afids, languages, sizes) lists of row i"""
+        start = self.starts[i]
+        end = start + self.counts[i]
+        return (self.afids[start:end].tolist(), [self.codes[code] for code in self.language_codes[start:end]],
+                self.sizes[start:end].tolist())
+
+class TorrentInfo:
+    """What the output stage needs of a torrents dump row"""
+    __slots__ = ('name', 'total_size', 'torrent_files', 'anidb_id')
+
+    def __init__(self, name, total_size, torrent_files, anidb_id):
+        self.name = name
+        self.total_size = total_size
+        self.torrent_files = torrent_files
+        self.anidb_id = anidb_id
+
+class TorrentTable(IdTable):
+    """torrent_id -> name/size/file count/anidb id and input digest"""
+    COLUMNS = (('names', None), ('total_sizes', 'q'), ('torrent_files', 'q'), ('anidb_ids', 'q'), ('crcs', 'I'))
+
+    def add(self, torrent_id, name, total_size, torrent_files, anidb_id, crc):
+        self.add_id(torrent_id)
+        self.names.append(name)
+        self.total_sizes.append(total_size)
+        self.torrent_files.append(torrent_files)
+        self.anidb_ids.append(anidb_id)
+        self.crcs.append(crc)
+
+    def get(self, torrent_id):
+        """TorrentInfo of a torrent, or None"""
+        i = self.find(torrent_id)
+        if i < 0:
+            return None
+        return TorrentInfo(self.names[i], self.total_sizes[i], self.torrent_files[i], self.anidb_ids[i])
+
+def load_attachment_sizes(path):
+    """afid -> file size from the attachmentfiles dump"""
     print("🔄 Building attachment file size lookup...")
-    attachment_sizes = {}
-    for line in data['attachmentfiles'][1:]:
-        parts = line.strip().split('\t')
+    attachment_sizes = AttachmentSizes()
+    for parts in stream_dump(path, 'attachmentfiles'):
         if len(parts) >= 4:
             try:
                 afid = int(parts[0])
                 filesize = int(parts[2])
-                attachment_sizes[afid] = filesize
-            except:
+                attachment_sizes.add(afid, filesize)
+            except Exception as e:
+                count_parse_failure('attachmentfiles', e)
                 continue
+        else:
+            count_parse_failure('attachmentfiles', 'short row')
+    attachment_sizes.sort()
 
     print(f"📊 Loaded {len(attachment_sizes)} attachment file sizes")
+    return attachment_sizes
 
-    # Process subtitles
+def load_subtitle_files(path, attachment_sizes):
+    """
+    file_id -> subtitle afids/languages/sizes from the attachments dump.
+    Also returns the highest file ID seen, the attachments watermark.
+    """
     print("🔄 Processing subtitles with actual sizes...")
-    subtitle_files = {}
-    for line in data['attachments'][1:]:
-        parts = line.strip().split('\t', 1)
+    subtitle_files = SubtitleFiles()
+    max_file_id = 0
+    for parts in stream_dump(path, 'attachments', maxsplit=1):
         if len(parts) == 2:
             try:
                 file_id = int(parts[0])
+                max_file_id = max(max_file_id, file_id)
                 attachment_data = json.loads(parts[1])
                 
                 afids, langs, sizes = [], [], []
@@ -226,17 +960,23 @@ def download_and_process():
                         sizes.append(attachment_sizes.get(afid, 50000))
                 
                 if afids:
-                    subtitle_files[file_id] = {'afids': afids, 'languages': langs, 'sizes': sizes}
-            except:
+                    crc = zlib.crc32(json.dumps([afids, langs, sizes]).encode())
+                    subtitle_files.add(file_id, afids, langs, sizes, crc)
+            except Exception as e:
+                count_parse_failure('attachments', e)
                 continue
+        else:
+            count_parse_failure('attachments', 'short row')
+    subtitle_files.sort()
     
     print(f"📊 Found {len(subtitle_files)} files with subtitles")
+    return subtitle_files, max_file_id
 
-    # Process torrent metadata
+def load_torrent_metadata(path):
+    """torrent_id -> name/size/file count/anidb id from the torrents dump"""
     print("🔄 Processing torrent metadata...")
-    torrent_metadata = {}
-    for line in data['torrents'][1:]:
-        parts = line.strip().split('\t')
+    torrent_metadata = TorrentTable()
+    for parts in stream_dump(path, 'torrents'):
         if len(parts) >= 28:
             try:
                 torrent_id = int(parts[0])
@@ -244,118 +984,88 @@ def download_and_process():
                 total_size = int(parts[10]) if len(parts) > 10 and parts[10].isdigit() else 0
                 torrent_files = int(parts[16]) if len(parts) > 16 and parts[16].isdigit() else 0
                 anidb_id = int(parts[29]) if len(parts) > 29 and parts[29].isdigit() else 0
+                crc = zlib.crc32(f'{name}\t{total_size}\t{torrent_files}\t{anidb_id}'.encode('utf-8', 'surrogatepass'))
                 
-                torrent_metadata[torrent_id] = {
-                    'name': name, 'total_size': total_size,
-                    'torrent_files': torrent_files, 'anidb_id': anidb_id
-                }
-            except:
+                torrent_metadata.add(torrent_id, name, total_size, torrent_files, anidb_id, crc)
+            except Exception as e:
+                count_parse_failure('torrents', e)
                 continue
+        else:
+            count_parse_failure('torrents', 'short row')
+    torrent_metadata.sort()
     
     print(f"📊 Processed metadata for {len(torrent_metadata)} torrents")
+    return torrent_metadata
 
-    # Build final database
-    torrents = {}
-    language_index = defaultdict(set)
+PACK_KEYWORDS = ['batch', 'complete', 'season', 'series', 'collection',
+                 'vol.', 'volume', 'multi-subs', 'multisubs', 'dual audio']
 
-    for line in data['files'][1:]:
-        parts = line.strip().split('\t')
-        if len(parts) >= 4:
-            try:
-                file_id, torrent_id, filename = int(parts[0]), int(parts[1]), parts[3]
-                
-                if file_id in subtitle_files and torrent_id in torrent_metadata:
-                    if torrent_id not in torrents:
-                        torrents[torrent_id] = {'files': [], 'languages': set(), 'episodes': {}}
-                    
-                    sub_data = subtitle_files[file_id]
-                    metadata = torrent_metadata[torrent_id]
-                    
-                    processed_languages = []
-                    for lang in sub_data['languages']:
-                        smart_lang = smart_language_detection(lang, metadata['name'], filename)
-                        processed_languages.append(smart_lang)
-                    
-                    episode_num, is_range, range_end, season, is_special = extract_episode_number(filename)
-                    
-                    file_entry = {
-                        'filename': filename, 'afids': sub_data['afids'],
-                        'languages': processed_languages, 'sizes': sub_data['sizes'],
-                        'episode_number': episode_num, 'is_range': is_range,
-                        'range_end': range_end, 'season': season
-                    }
-                    
-                    torrents[torrent_id]['files'].append(file_entry)
-                    
-                    if episode_num:
-                        # Store episode (ranges stay as single entry with range_end info)
-                        torrents[torrent_id]['episodes'][episode_num] = file_entry
-                    
-                    for lang in processed_languages:
-                        torrents[torrent_id]['languages'].add(lang)
-                        language_index[lang].add(torrent_id)
-            except:
-                continue
-    
-    print(f"📊 Found {len(torrents)} torrents with subtitles")
-    sys.stdout.flush()
+def final_entry(torrent_data, metadata):
+    """One final_db entry: a joined torrent plus its pack entry and summary fields. Returns (entry, has_pack)."""
+    name = metadata.name
+    subtitle_files_list = torrent_data['files'].copy()
+    unique_languages = {}
+    total_subtitle_files = 0
+    total_subtitle_size = 0
 
-    # Build final database with packs
-    final_db = {}
+    for sub_file in subtitle_files_list:
+        unique_languages.update(dict.fromkeys(sub_file['languages']))
+        total_subtitle_files += len(sub_file['afids'])
+        total_subtitle_size += sum(sub_file['sizes'])
+
+    has_pack = (
+        total_subtitle_files >= 3 or len(unique_languages) >= 2 or
+        metadata.torrent_files > 3 or metadata.total_size > 1073741824 or
+        total_subtitle_size > 1000000 or
+        any(keyword in name.lower() for keyword in PACK_KEYWORDS)
+    )
+
+    if has_pack and len(torrent_data['files']) > 1:
+        total_size = sum(sum(f['sizes']) for f in torrent_data['files'])
+        
+        subtitle_files_list.append({
+            'filename': 'All Attachments (Complete Pack)',
+            'afids': [0], 'languages': list(unique_languages),
+            'sizes': [max(total_size, 2000000)], 'is_pack': True,
+            'pack_type': 'complete', 'pack_name': name,
+            'pack_url_type': 'torattachpk'
+        })
+
+    entry = {
+        'name': name, 'languages': list(torrent_data['languages']),
+        'subtitle_files': subtitle_files_list, 'torrent_files': metadata.torrent_files,
+        'total_size': metadata.total_size, 'anidb_id': metadata.anidb_id,
+        'episodes_available': list(torrent_data['episodes'].keys()),
+        'url_accuracy': {
+            'individual_files_count': len([f for f in subtitle_files_list if f.get('pack_url_type') == 'attach']),
+            'complete_pack_available': any(f.get('pack_url_type') == 'torattachpk' for f in subtitle_files_list),
+            'accuracy_level': 'high'
+        }
+    }
+    return entry, has_pack
+
+def build_final_db(torrents, torrent_metadata):
+    """Add pack entries and per-torrent summary fields to the joined torrents, given {torrent_id: TorrentInfo}"""
+    return dict(iter_final_db([(torrents, torrent_metadata)]))
+
+def iter_final_db(buckets):
+    """
+    Yield (torrent id, final_db entry) per torrent, in ascending ID order when
+    buckets are (joined torrents, metadata) pairs in ID order, such as
+    JoinSpill.load() results. Each torrent's joined data is dropped once its
+    entry is built.
+    """
     pack_count = 0
     processed = 0
 
-    for torrent_id in torrents:
-        if torrent_id in torrent_metadata:
-            metadata = torrent_metadata[torrent_id]
-            name = metadata['name']
-            torrent_data = torrents[torrent_id]
-            
-            subtitle_files_list = torrent_data['files'].copy()
-            unique_languages = set()
-            total_subtitle_files = 0
-            total_subtitle_size = 0
-
-            for sub_file in subtitle_files_list:
-                unique_languages.update(sub_file['languages'])
-                total_subtitle_files += len(sub_file['afids'])
-                total_subtitle_size += sum(sub_file['sizes'])
-
-            has_pack = (
-                total_subtitle_files >= 3 or len(unique_languages) >= 2 or
-                metadata['torrent_files'] > 3 or metadata['total_size'] > 1073741824 or
-                total_subtitle_size > 1000000 or
-                any(keyword in name.lower() for keyword in [
-                    'batch', 'complete', 'season', 'series', 'collection',
-                    'vol.', 'volume', 'multi-subs', 'multisubs', 'dual audio'
-                ])
-            )
-
-            if has_pack:
-                if len(torrent_data['files']) > 1:
-                    total_size = sum(sum(f['sizes']) for f in torrent_data['files'])
-                    
-                    subtitle_files_list.append({
-                        'filename': 'All Attachments (Complete Pack)',
-                        'afids': [0], 'languages': list(unique_languages),
-                        'sizes': [max(total_size, 2000000)], 'is_pack': True,
-                        'pack_type': 'complete', 'pack_name': name,
-                        'pack_url_type': 'torattachpk'
-                    })
-
-                pack_count += 1
-
-            final_db[str(torrent_id)] = {
-                'name': name, 'languages': list(torrents[torrent_id]['languages']),
-                'subtitle_files': subtitle_files_list, 'torrent_files': metadata['torrent_files'],
-                'total_size': metadata['total_size'], 'anidb_id': metadata['anidb_id'],
-                'episodes_available': list(torrent_data['episodes'].keys()),
-                'url_accuracy': {
-                    'individual_files_count': len([f for f in subtitle_files_list if f.get('pack_url_type') == 'attach']),
-                    'complete_pack_available': any(f.get('pack_url_type') == 'torattachpk' for f in subtitle_files_list),
-                    'accuracy_level': 'high'
-                }
-            }
+    for torrents, torrent_metadata in buckets:
+        for torrent_id in sorted(torrents):
+            torrent_data = torrents.pop(torrent_id)
+            if torrent_id not in torrent_metadata:
+                continue
+            entry, has_pack = final_entry(torrent_data, torrent_metadata[torrent_id])
+            pack_count += has_pack
+            yield str(torrent_id), entry
             
             processed += 1
             if processed % 50000 == 0:
@@ -364,161 +1074,1419 @@ def download_and_process():
 
     print(f"📦 Added packs for {pack_count} torrents")
 
-    # Create GitHub Pages structure
-    os.makedirs('docs', exist_ok=True)
-    
-    # Sort and chunk
-    sorted_ids = sorted(final_db.keys(), key=int)
-    chunk_size = 50000
-    chunks = [sorted_ids[i:i+chunk_size] for i in range(0, len(sorted_ids), chunk_size)]
-    
-    index = {'chunks': [], 'total': len(final_db), 'languages': list(language_index.keys())}
-    
-    for i, chunk_ids in enumerate(chunks):
-        chunk_data = {tid: final_db[tid] for tid in chunk_ids}
-        
-        with open(f'docs/subtitles_{i}.json', 'w') as f:
-            json.dump(chunk_data, f, separators=(',', ':'))
-        
-        index['chunks'].append({
-            'id': i,
-            'url': f'https://yacoubs00.github.io/Animetosho-Yacoubs-Subtitles/subtitles_{i}.json',
-            'min_id': int(chunk_ids[0]),
-            'max_id': int(chunk_ids[-1]),
-            'count': len(chunk_ids)
-        })
-        
-        size_mb = os.path.getsize(f'docs/subtitles_{i}.json') / 1024 / 1024
-        print(f"✅ Chunk {i}: {len(chunk_ids)} torrents ({size_mb:.1f}MB)")
-    
+CHUNK_SIZE = 50000
+PAGES_URL = 'https://yacoubs00.github.io/Animetosho-Yacoubs-Subtitles'
+
+def chunk_path(chunk_id):
+    return f'docs/subtitles_{chunk_id}.json'
+
+def compact_chunk_path(chunk_id):
+    """Columnar copy of a chunk (see compact_chunks.py), with .gz/.br siblings"""
+    return f'docs/subtitles_{chunk_id}.cols.json'
+
+def compact_chunk_files(chunk_id):
+    path = compact_chunk_path(chunk_id)
+    return [path, path + '.gz', path + '.br']
+
+def write_chunk(chunk_id, chunk_data, previous_hash=None):
+    """Serialize a chunk and write it only if its content changed. Returns its sha256."""
+    payload = json.dumps(chunk_data, separators=(',', ':')).encode()
+    digest = hashlib.sha256(payload).hexdigest()
+    path = chunk_path(chunk_id)
+    if digest != previous_hash or not os.path.exists(path) or not os.path.exists(compact_chunk_path(chunk_id)):
+        with open(path, 'wb') as f:
+            f.write(payload)
+        compact = json.dumps(encode_chunk(chunk_data), separators=(',', ':')).encode()
+        sizes = {'': len(compact)}
+        with open(compact_chunk_path(chunk_id), 'wb') as f:
+            f.write(compact)
+        for suffix, compressed in compressed_payloads(compact):
+            with open(compact_chunk_path(chunk_id) + suffix, 'wb') as f:
+                f.write(compressed)
+            sizes[suffix] = len(compressed)
+        # No stale .br left behind when brotli is not installed
+        for stale in compact_chunk_files(chunk_id)[1:]:
+            if stale[len(compact_chunk_path(chunk_id)):] not in sizes and os.path.exists(stale):
+                os.remove(stale)
+        size_mb = len(payload) / 1024 / 1024
+        compact_sizes = ', '.join(f"{suffix or 'columnar'} {size / 1024 / 1024:.2f}MB" for suffix, size in sizes.items())
+        print(f"✅ Chunk {chunk_id}: {len(chunk_data)} torrents ({size_mb:.1f}MB, {compact_sizes})")
+    else:
+        print(f"⏭️ Chunk {chunk_id}: unchanged")
+    return digest
+
+def write_index(chunks, languages, search_splits):
+    index = {
+        'chunks': [{
+            'id': chunk['id'],
+            'url': f"{PAGES_URL}/subtitles_{chunk['id']}.json",
+            'compact_url': f"{PAGES_URL}/subtitles_{chunk['id']}.cols.json",
+            'min_id': chunk['min_id'],
+            'max_id': chunk['max_id'],
+            'count': chunk['count']
+        } for chunk in chunks],
+        'total': sum(chunk['count'] for chunk in chunks),
+        'languages': languages,
+        'search': {
+            'tokens_url': f"{PAGES_URL}/search/tokens_{{shard}}.json",
+            'torrents_url': f"{PAGES_URL}/search/torrents_{{shard}}.json",
+            'token_prefix': SEARCH_PREFIX,
+            'split_shards': search_splits,
+            'stopwords': sorted(SEARCH_STOPWORDS),
+            'skip_pattern': SEARCH_SKIP_PATTERN,
+            'torrent_ids_per_shard': SEARCH_TORRENT_IDS
+        }
+    }
     with open('docs/index.json', 'w') as f:
         json.dump(index, f, separators=(',', ':'))
-    
-    print(f"✅ GitHub Pages database built: {len(final_db)} torrents, {len(language_index)} languages")
 
-    # === TURSO UPSERT - No duplicate checking, just write! ===
-    print("🔄 Uploading to TURSO Database (UPSERT - no reads needed)...")
+class PagesWriter:
+    """
+    Full build of the docs/ chunks from torrents added in ascending ID order.
+    Each chunk is written as soon as it fills, so only one is held in memory.
+    """
+    def __init__(self, previous_chunks=()):
+        os.makedirs('docs', exist_ok=True)
+        self.previous_hashes = {chunk['id']: chunk.get('sha256') for chunk in previous_chunks}
+        self.chunks = []
+        self.chunk_data = {}
+
+    def add(self, tid, entry):
+        self.chunk_data[tid] = entry
+        if len(self.chunk_data) >= CHUNK_SIZE:
+            self.write_chunk()
+
+    def write_chunk(self):
+        chunk_data, self.chunk_data = self.chunk_data, {}
+        if not chunk_data:
+            return
+        chunk_id = len(self.chunks)
+        self.chunks.append({
+            'id': chunk_id, 'min_id': int(next(iter(chunk_data))), 'max_id': int(next(reversed(chunk_data))),
+            'count': len(chunk_data), 'sha256': write_chunk(chunk_id, chunk_data, self.previous_hashes.get(chunk_id))
+        })
+
+    def finish(self, languages, search_splits):
+        """Write the last chunk and index.json. Returns the manifest chunk list."""
+        self.write_chunk()
+        # Chunks left over from a bigger previous build
+        for chunk_id in self.previous_hashes:
+            if chunk_id >= len(self.chunks):
+                for path in [chunk_path(chunk_id)] + compact_chunk_files(chunk_id):
+                    if os.path.exists(path):
+                        os.remove(path)
+        
+        write_index(self.chunks, languages, search_splits)
+        return self.chunks
+
+def update_pages(final_db, removed_ids, languages, previous_chunks, search_splits):
+    """
+    Incremental build: merge changed torrents into the chunks whose ID range
+    holds them and rewrite only those. Torrents past the last chunk fill it
+    up to CHUNK_SIZE and then start new chunks. Returns the manifest chunk list.
+    """
+    chunks = [dict(chunk) for chunk in previous_chunks]
+    min_ids = [chunk['min_id'] for chunk in chunks]
+    updates = defaultdict(dict)
+
+    for tid in sorted(set(final_db) | {str(t) for t in removed_ids}, key=int):
+        torrent_id = int(tid)
+        entry = final_db.get(tid)
+        i = max(bisect_right(min_ids, torrent_id) - 1, 0) if chunks else -1
+        if entry is not None and (i < 0 or (i == len(chunks) - 1 and torrent_id > chunks[i]['max_id'] and
+                                            chunks[i]['count'] + len(updates[i]) >= CHUNK_SIZE)):
+            chunks.append({'id': len(chunks), 'min_id': torrent_id, 'max_id': torrent_id, 'count': 0, 'sha256': None})
+            min_ids.append(torrent_id)
+            i = len(chunks) - 1
+        if i >= 0:
+            updates[i][tid] = entry
+
+    for i, changes in sorted(updates.items()):
+        chunk = chunks[i]
+        path = chunk_path(chunk['id'])
+        chunk_data = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                chunk_data = json.load(f)
+        for tid, entry in changes.items():
+            if entry is None:
+                chunk_data.pop(tid, None)
+            else:
+                chunk_data[tid] = entry
+        chunk_data = {tid: chunk_data[tid] for tid in sorted(chunk_data, key=int)}
+        if chunk_data:
+            chunk['min_id'] = min(chunk['min_id'], int(next(iter(chunk_data))))
+            chunk['max_id'] = max(chunk['max_id'], int(next(reversed(chunk_data))))
+        chunk['count'] = len(chunk_data)
+        chunk['sha256'] = write_chunk(chunk['id'], chunk_data, chunk.get('sha256'))
+
+    write_index(chunks, languages, search_splits)
+    return chunks
+
+# Static search index next to the chunks: title tokens -> delta-encoded
+# torrent IDs, sharded by the first SEARCH_PREFIX characters of the token, and
+# an episode map of torrent ID -> [name, episode ranges], sharded by
+# SEARCH_TORRENT_IDS IDs. Token shards over SEARCH_SHARD_BYTES are split by
+# one more token character. Every shard has .gz/.br siblings like the chunks.
+SEARCH_DIR = 'docs/search'
+SEARCH_PREFIX = 2
+SEARCH_TORRENT_IDS = 500
+SEARCH_SHARD_BYTES = 16 * 1024
+# Bumped when the docs/search layout changes, so the next build is a full one
+SEARCH_FORMAT = 2
+# Words too common to narrow a search, and release info outside brackets:
+# bare numbers, resolutions, codecs, season and episode markers. Clients drop
+# them from queries too, so both are published in index.json.
+SEARCH_STOPWORDS = frozenset((
+    'the', 'an', 'of', 'and', 'to', 'in', 'on', 'no', 'wa', 'ga', 'wo', 'ni', 'de',
+    'season', 'final', 'episode', 'ep', 'vol', 'part', 'batch', 'complete',
+    'web', 'dl', 'webrip', 'bdrip', 'bluray', 'bd', 'hevc', 'avc', 'flac', 'opus', 'dual', 'audio', 'multi', 'sub', 'subs'))
+SEARCH_SKIP_PATTERN = (r'^(?:[0-9]+(?:p|i|k|bit|st|nd|rd|th)?|[0-9]+x[0-9]+|s[0-9]+(?:e[0-9]+)?|e[0-9]+|ep[0-9]+|'
+                       r'v[0-9]+|[xh]26[45]|aac[0-9]*|ddp?[0-9]*)$')
+_SEARCH_SKIP_RE = re.compile(SEARCH_SKIP_PATTERN)
+_TOKEN_RE = re.compile(r'\w+')
+
+def title_tokens(name):
+    """Indexed words of a torrent name: its normalized title minus stopwords and release info"""
+    return [token for token in dict.fromkeys(_TOKEN_RE.findall(normalize_title(name)))
+            if len(token) >= 2 and token not in SEARCH_STOPWORDS and not _SEARCH_SKIP_RE.match(token)]
+
+def token_shard(token, splits=()):
+    """
+    Shard of a token: its prefix when that is plain ASCII, else its first
+    character, extended by one token character while the shard is in splits
+    """
+    shard = token[:SEARCH_PREFIX]
+    if not (shard.isascii() and shard.isalnum()):
+        shard = token[0]
+    while shard in splits and len(token) > len(shard):
+        shard = token[:len(shard) + 1]
+    return shard
+
+def shard_file_name(shard):
+    """A shard as it appears in file names: ASCII letters and digits kept, other characters as _hex_"""
+    return ''.join(c if c.isascii() and c.isalnum() else f'_{ord(c):x}_' for c in shard)
+
+def token_shard_path(shard):
+    return f'{SEARCH_DIR}/tokens_{shard_file_name(shard)}.json'
+
+def torrent_shard_path(shard):
+    return f'{SEARCH_DIR}/torrents_{shard}.json'
+
+def search_shard_files(path):
+    return [path, path + '.gz', path + '.br']
+
+def encode_postings(ids):
+    """Ascending torrent IDs as the first ID followed by the gaps between them"""
+    return [ids[0]] + [b - a for a, b in zip(ids, ids[1:])] if ids else []
+
+def decode_postings(deltas):
+    return list(accumulate(deltas))
+
+def torrent_record(torrent_id, entry):
+    """[name, "1-12,15"] with every episode the torrent covers, as in episode_coverage"""
+    filenames = [sf.get('filename', '') for sf in entry.get('subtitle_files', [])]
+    episodes = sorted({row[2] for row in episode_coverage_rows(torrent_id, entry['name'], filenames)})
+    ranges = []
+    for episode in episodes:
+        if ranges and ranges[-1][1] == episode - 1:
+            ranges[-1][1] = episode
+        else:
+            ranges.append([episode, episode])
+    return [entry['name'], ','.join(str(a) if a == b else f'{a}-{b}' for a, b in ranges)]
+
+def search_shard_payload(data):
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode()
+
+def split_token_shards(postings, splits):
+    """
+    {shard: {token: encoded IDs}} of encoded postings. A shard of several
+    tokens over SEARCH_SHARD_BYTES is added to splits and its tokens move one
+    character deeper; a token as long as the shard itself stays in it.
+    """
+    pending = defaultdict(dict)
+    for token, ids in postings.items():
+        pending[token_shard(token, splits)][token] = ids
+    shards = {}
+    while pending:
+        shard, tokens = pending.popitem()
+        if (len(tokens) > 1 and len(search_shard_payload(tokens)) > SEARCH_SHARD_BYTES
+                and any(len(token) > len(shard) for token in tokens)):
+            splits.add(shard)
+            for token, ids in tokens.items():
+                pending[token_shard(token, splits)][token] = ids
+        else:
+            shards[shard] = dict(sorted(tokens.items()))
+    return shards
+
+def write_search_shard(path, data):
+    """
+    Write a shard and its compressed siblings if its content changed, remove
+    them once it is empty. Returns True if the shard changed.
+    """
+    if not data:
+        removed = False
+        for sibling in search_shard_files(path):
+            if os.path.exists(sibling):
+                os.remove(sibling)
+                removed = True
+        return removed
+    payload = search_shard_payload(data)
+    if os.path.exists(path) and os.path.exists(path + '.gz'):
+        with open(path, 'rb') as f:
+            if f.read() == payload:
+                return False
+    with open(path, 'wb') as f:
+        f.write(payload)
+    written = {path}
+    for suffix, compressed in compressed_payloads(payload):
+        with open(path + suffix, 'wb') as f:
+            f.write(compressed)
+        written.add(path + suffix)
+    # No stale .br left behind when brotli is not installed
+    for stale in search_shard_files(path):
+        if stale not in written and os.path.exists(stale):
+            os.remove(stale)
+    return True
+
+def read_search_shard(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+class SearchIndexWriter:
+    """
+    Full build of docs/search/ from torrents added in ascending ID order.
+    Episode map shards are written once the IDs move past them; token postings
+    are kept as flat ID arrays until finish(). Files no shard maps to anymore
+    are removed.
+    """
+    def __init__(self):
+        os.makedirs(SEARCH_DIR, exist_ok=True)
+        self.postings = defaultdict(lambda: array('q'))
+        self.records = {}
+        self.shard = None
+        self.paths = set()
+        self.torrent_shards = 0
+        self.changed = 0
+
+    def add(self, tid, entry):
+        torrent_id = int(tid)
+        for token in title_tokens(entry['name']):
+            self.postings[token].append(torrent_id)
+        shard = torrent_id // SEARCH_TORRENT_IDS
+        if shard != self.shard:
+            self.write_records()
+            self.shard = shard
+        self.records[tid] = torrent_record(torrent_id, entry)
+
+    def write_records(self):
+        if self.records:
+            path = torrent_shard_path(self.shard)
+            self.paths.update(search_shard_files(path))
+            self.torrent_shards += 1
+            self.changed += write_search_shard(path, self.records)
+        self.records = {}
+
+    def finish(self):
+        """Write the token shards and clean up. Returns the split shards, for index.json."""
+        self.write_records()
+        postings = {token: encode_postings(ids.tolist()) for token, ids in self.postings.items()}
+        self.postings.clear()
+        splits = set()
+        shards = split_token_shards(postings, splits)
+        for shard, tokens in shards.items():
+            path = token_shard_path(shard)
+            self.paths.update(search_shard_files(path))
+            self.changed += write_search_shard(path, tokens)
+        for filename in os.listdir(SEARCH_DIR):
+            path = f'{SEARCH_DIR}/{filename}'
+            if path not in self.paths:
+                os.remove(path)
+                self.changed += 1
+        print(f"✅ Search index built: {len(shards)} token shards ({len(splits)} split), "
+              f"{self.torrent_shards} torrent shards ({self.changed} files changed)")
+        return sorted(splits)
+
+def update_search_index(final_db, removed_ids, splits):
+    """
+    Incremental build: rewrite the episode map entries of changed torrents and
+    move their IDs between token postings. Old tokens come from the name in the
+    previous episode map entry. Token shards that grow too big are split; ones
+    that shrink are not merged back. Returns the split shards, for index.json.
+    """
+    os.makedirs(SEARCH_DIR, exist_ok=True)
+    splits = set(splits)
+    changes = defaultdict(dict)
+    for tid, entry in final_db.items():
+        changes[int(tid) // SEARCH_TORRENT_IDS][tid] = entry
+    for torrent_id in removed_ids:
+        changes[int(torrent_id) // SEARCH_TORRENT_IDS][str(torrent_id)] = None
+
+    token_changes = defaultdict(lambda: defaultdict(dict))
+    changed = 0
+    for shard, shard_changes in changes.items():
+        records = read_search_shard(torrent_shard_path(shard))
+        for tid, entry in shard_changes.items():
+            old = records.pop(tid, None)
+            old_tokens = set(title_tokens(old[0])) if old else set()
+            new_tokens = set(title_tokens(entry['name'])) if entry else set()
+            for token in old_tokens - new_tokens:
+                token_changes[token_shard(token, splits)][token][int(tid)] = False
+            for token in new_tokens - old_tokens:
+                token_changes[token_shard(token, splits)][token][int(tid)] = True
+            if entry is not None:
+                records[tid] = torrent_record(int(tid), entry)
+        records = {tid: records[tid] for tid in sorted(records, key=int)}
+        changed += write_search_shard(torrent_shard_path(shard), records)
+
+    for shard, tokens in token_changes.items():
+        postings = {token: decode_postings(ids) for token, ids in read_search_shard(token_shard_path(shard)).items()}
+        for token, ids in tokens.items():
+            current = set(postings.get(token, ()))
+            current.update(torrent_id for torrent_id, added in ids.items() if added)
+            current.difference_update(torrent_id for torrent_id, added in ids.items() if not added)
+            postings[token] = sorted(current)
+        postings = {token: encode_postings(ids) for token, ids in postings.items() if ids}
+        rewritten = split_token_shards(postings, splits)
+        # Emptied, or split into deeper shards
+        rewritten.setdefault(shard, {})
+        for new_shard, new_tokens in rewritten.items():
+            changed += write_search_shard(token_shard_path(new_shard), new_tokens)
+    print(f"✅ Search index updated: {changed} files changed, {len(splits)} split token shards")
+    return sorted(splits)
+
+# Build stages in run order. Each one checkpoints its output, so a build that
+# died or timed out resumes after the last finished stage.
+BUILD_STAGES = ('fetch', 'sizes', 'subtitles', 'metadata', 'join', 'pack', 'write', 'upload')
+STAGE_DIR = 'data/stages'
+# Stages whose outputs are only needed to resume or re-run later stages
+PRUNED_STAGES = ('sizes', 'subtitles', 'metadata', 'join', 'pack')
+# Final entries pickled per frame in the pack stage's checkpoint
+ENTRY_FRAME = 1000
+ENTRIES_FILE = 'entries.pickle'
+# Per-run telemetry report; a --profile-stage profile is written next to it
+REPORT_PATH = 'data/build_report.json'
+PROFILE_TOP_FUNCTIONS = 15
+
+class StageError(Exception):
+    pass
+
+class StageStore:
+    """
+    Checkpoints of BUILD_STAGES: one directory per stage holding its outputs
+    and a done.json marker, written last. Starting a stage discards its own
+    and every later stage's checkpoint, so finished stages always form a
+    prefix of BUILD_STAGES and a rerun carries on after the last of them.
+    """
+    MARKER = 'done.json'
+
+    def __init__(self, directory=STAGE_DIR):
+        self.directory = directory
+
+    def path(self, stage, name=''):
+        return os.path.join(self.directory, stage, name)
+
+    def marker(self, stage):
+        """The info a finished stage recorded, or None"""
+        try:
+            with open(self.path(stage, self.MARKER)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def finished(self):
+        return self.marker(BUILD_STAGES[-1]) is not None
+
+    def next_stage(self):
+        return next((stage for stage in BUILD_STAGES if self.marker(stage) is None), None)
+
+    def start(self, stage):
+        for later in BUILD_STAGES[BUILD_STAGES.index(stage):]:
+            shutil.rmtree(self.path(later), ignore_errors=True)
+        os.makedirs(self.path(stage))
+
+    def finish(self, stage, info):
+        part_path = self.path(stage, self.MARKER + '.part')
+        with open(part_path, 'w') as f:
+            json.dump(dict(info, finished_at=int(time.time())), f)
+        os.replace(part_path, self.path(stage, self.MARKER))
+
+    def save(self, stage, name, value):
+        with open(self.path(stage, name), 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, stage, name):
+        with open(self.path(stage, name), 'rb') as f:
+            return pickle.load(f)
+
+    def prune(self):
+        """Drop the intermediate outputs of a finished build; its fetch, write and upload markers stay"""
+        for stage in PRUNED_STAGES:
+            shutil.rmtree(self.path(stage), ignore_errors=True)
+
+def dump_fingerprint(cache_dir, incremental):
+    """
+    What a build starts from: the cached dumps, by their upstream validators
+    and size, and the build mode. Decompressed copies may be recreated from the
+    same dump without changing it.
+    """
+    dumps = {}
+    for name in DUMP_NAMES:
+        xz_path, _ = dump_cache_paths(cache_dir, name)
+        dumps[name] = [load_validators(xz_path + '.json'), os.path.getsize(xz_path)]
+    return {'dumps': dumps, 'incremental': incremental}
+
+def write_entries(path, entries):
+    """Pickle (torrent id, entry) pairs in frames of ENTRY_FRAME. Returns how many were written."""
+    count = 0
+    frame = []
+    with open(path, 'wb') as f:
+        for item in entries:
+            frame.append(item)
+            if len(frame) >= ENTRY_FRAME:
+                pickle.dump(frame, f, protocol=pickle.HIGHEST_PROTOCOL)
+                count += len(frame)
+                frame = []
+        if frame:
+            pickle.dump(frame, f, protocol=pickle.HIGHEST_PROTOCOL)
+            count += len(frame)
+    return count
+
+def read_entries(path):
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                frame = pickle.load(f)
+            except EOFError:
+                return
+            yield from frame
+
+def reset_peak_rss():
+    """Restart the kernel's peak RSS count for this process (Linux only). Returns whether it did."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb():
+    """Peak RSS since the last reset_peak_rss, or of the whole process where it can't be reset"""
     try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    if resource is None:
+        return None
+    # Kilobytes, except on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def counter_delta(after, before):
+    return {key: after[key] - before[key] for key in after if after[key] != before[key]}
+
+class BuildTelemetry:
+    """
+    Wall and CPU time, rows, bytes, peak RSS and parse failures of every stage
+    a build run goes through, saved as a JSON report. One stage can be run
+    under cProfile; its stats are saved next to the report.
+    """
+    def __init__(self, path=REPORT_PATH, profile_stage=None):
+        self.path = path
+        self.profile_stage = profile_stage
+        self.report = {
+            'version': 1, 'status': 'running', 'started_at': int(time.time()),
+            'python': platform.python_version(), 'platform': sys.platform, 'stages': []
+        }
+
+    @contextmanager
+    def stage(self, name):
+        """Measure the body as one stage. Yields the stage's record, for the body to add rows_out and the like."""
+        record = {'stage': name, 'status': 'running'}
+        self.report['stages'].append(record)
+        rows_before, bytes_before = Counter(dump_rows_read), Counter(dump_bytes_read)
+        failures_before = Counter(parse_failures)
+        workers_before = resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+        stage_peak = reset_peak_rss()
+        profiler = cProfile.Profile() if name == self.profile_stage else None
+        started, cpu_started = time.perf_counter(), time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+            record['status'] = 'finished'
+        except BaseException as e:
+            record['status'] = 'failed'
+            record['error'] = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+            wall = time.perf_counter() - started
+            record['wall_seconds'] = round(wall, 3)
+            record['cpu_seconds'] = round(time.process_time() - cpu_started, 3)
+            if workers_before:
+                workers = resource.getrusage(resource.RUSAGE_CHILDREN)
+                workers_cpu = (workers.ru_utime + workers.ru_stime) - (workers_before.ru_utime + workers_before.ru_stime)
+                if workers_cpu > 0:
+                    record['workers_cpu_seconds'] = round(workers_cpu, 3)
+            rows_read = counter_delta(dump_rows_read, rows_before)
+            if rows_read:
+                record['rows_read'] = rows_read
+                record['rows_in'] = sum(rows_read.values())
+                record['bytes_read'] = sum(counter_delta(dump_bytes_read, bytes_before).values())
+            elif 'rows_out' in record:
+                record.setdefault('rows_in', record['rows_out'])
+            if record.get('rows_in') is not None and wall > 0:
+                record['rows_per_sec'] = round(record['rows_in'] / wall, 1)
+            peak = peak_rss_mb()
+            if peak is not None:
+                record['peak_rss_mb'] = round(peak, 1)
+                # ru_maxrss/VmHWM only ever grow where they can't be reset
+                record['peak_rss_scope'] = 'stage' if stage_peak else 'process'
+            failures = defaultdict(dict)
+            for (dump, reason), count in counter_delta(parse_failures, failures_before).items():
+                failures[dump][reason] = count
+            record['parse_failures'] = dict(failures)
+            if profiler:
+                record['profile'] = self.save_profile(name, profiler)
+
+    def save_profile(self, name, profiler):
+        base = os.path.splitext(self.path)[0] if self.path else 'build_report'
+        path = f'{base}_{name}.prof'
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(path)
+        print(f"📊 Profile of stage {name} saved to {path} (python -m pstats {path}), slowest calls:")
+        pstats.Stats(profiler, stream=sys.stdout).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        return path
+
+    def summary(self, record):
+        """One line for the build log"""
+        parts = [f"{record['wall_seconds']:.1f}s", f"cpu {record['cpu_seconds']:.1f}s"]
+        if 'workers_cpu_seconds' in record:
+            parts.append(f"workers cpu {record['workers_cpu_seconds']:.1f}s")
+        if 'rows_per_sec' in record:
+            parts.append(f"{record['rows_in']:,} rows in, {record['rows_per_sec']:,.0f} rows/sec")
+        if 'peak_rss_mb' in record:
+            parts.append(f"peak RSS {record['peak_rss_mb']:.0f}MB")
+        return ', '.join(parts)
+
+    def warn_parse_failures(self, record):
+        for dump, reasons in record['parse_failures'].items():
+            details = ', '.join(f'{reason} {count:,}' for reason, count in sorted(reasons.items()))
+            print(f"⚠️ {dump}: skipped {sum(reasons.values()):,} rows that would not parse ({details})")
+
+    def finish(self, status):
+        self.report['status'] = status
+        self.report['finished_at'] = int(time.time())
+        stages = self.report['stages']
+        failures = defaultdict(Counter)
+        for record in stages:
+            for dump, reasons in record.get('parse_failures', {}).items():
+                failures[dump].update(reasons)
+        self.report['totals'] = {
+            'wall_seconds': round(sum(record.get('wall_seconds', 0) for record in stages), 3),
+            'cpu_seconds': round(sum(record.get('cpu_seconds', 0) + record.get('workers_cpu_seconds', 0)
+                                     for record in stages), 3),
+            'peak_rss_mb': max((record['peak_rss_mb'] for record in stages if 'peak_rss_mb' in record), default=None),
+            'parse_failures': {dump: dict(reasons) for dump, reasons in failures.items()},
+        }
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + '.part', 'w') as f:
+            json.dump(self.report, f, indent=2)
+        os.replace(self.path + '.part', self.path)
+        print(f"📊 Build report saved to {self.path}")
+
+class StagedBuild:
+    """
+    Everything after fetch, run as BUILD_STAGES checkpointed in a StageStore.
+    A stage takes what earlier stages produced from memory when they ran in
+    this process, or from their checkpoints when the build was resumed or a
+    single stage is re-run.
+    """
+    def __init__(self, store, dump_paths, workers=1, incremental=False, state_dir='data/build_state',
+                 upload_options=None, telemetry=None):
+        self.store = store
+        self.dump_paths = dump_paths
+        self.workers = workers
+        self.incremental = incremental
+        self.state_dir = state_dir
+        self.upload_options = upload_options or {}
+        self.telemetry = telemetry or BuildTelemetry(None)
+        self.values = {}
+
+    def run(self, stages):
+        for stage in stages:
+            missing = next((s for s in BUILD_STAGES[:BUILD_STAGES.index(stage)] if self.store.marker(s) is None), None)
+            if missing:
+                raise StageError(f"Stage {stage} needs the {missing} checkpoint, run with --from-stage {missing}")
+            print(f"▶️ Stage {stage}")
+            sys.stdout.flush()
+            with self.telemetry.stage(stage) as record:
+                self.store.start(stage)
+                info = getattr(self, f'stage_{stage}')()
+                self.store.finish(stage, info)
+                record['rows_out'] = info['rows'] if 'rows' in info else info.get('torrents')
+            self.telemetry.warn_parse_failures(record)
+            print(f"✅ Stage {stage} finished: {self.telemetry.summary(record)}")
+            sys.stdout.flush()
+
+    def keep(self, stage, name, value):
+        self.store.save(stage, name, value)
+        self.values[stage, name] = value
+
+    def take(self, stage, name):
+        """A checkpointed value, no longer held here once taken"""
+        if (stage, name) in self.values:
+            return self.values.pop((stage, name))
+        return self.store.load(stage, name)
+
+    def stage_sizes(self):
+        attachment_sizes = load_attachment_sizes(self.dump_paths['attachmentfiles'])
+        self.keep('sizes', 'sizes.pickle', attachment_sizes)
+        return {'rows': len(attachment_sizes)}
+
+    def stage_subtitles(self):
+        subtitle_files, max_attachment_id = load_subtitle_files(
+            self.dump_paths['attachments'], self.take('sizes', 'sizes.pickle'))
+        self.keep('subtitles', 'subtitles.pickle', subtitle_files)
+        return {'rows': len(subtitle_files), 'max_attachment_id': max_attachment_id}
+
+    def stage_metadata(self):
+        torrent_metadata = load_torrent_metadata(self.dump_paths['torrents'])
+        self.keep('metadata', 'metadata.pickle', torrent_metadata)
+        return {'rows': len(torrent_metadata)}
+
+    def stage_join(self):
+        previous = BuildState.load(self.state_dir) if self.incremental else None
+        if self.incremental and not previous:
+            print("⚠️ No usable build state found, running a full build")
+        subtitle_files = self.take('subtitles', 'subtitles.pickle')
+        torrent_metadata = self.take('metadata', 'metadata.pickle')
+
+        print("🔄 Scanning files for changes...")
+        file_digests, torrent_digests, max_file_id, dirty = scan_file_changes(
+            stream_dump(self.dump_paths['files'], 'files'), subtitle_files, torrent_metadata, previous)
+        if previous:
+            # Torrents whose TURSO upload failed last time
+            dirty.update(previous.manifest.get('pending_upload', []))
+            print(f"📊 {len(dirty):,} torrents changed since the last build")
+        file_digests.save(self.store.path('join', BuildState.FILES))
+        torrent_digests.save(self.store.path('join', BuildState.TORRENTS))
+        self.store.save('join', 'dirty.pickle', sorted(dirty))
+        del file_digests, torrent_digests
+
+        # Join into the on-disk spill, the pack stage reads it back bucket by bucket
+        print(f"🔄 Joining files with subtitles ({self.workers} worker{'s' if self.workers != 1 else ''})...")
+        file_rows = stream_dump(self.dump_paths['files'], 'files')
+        if previous:
+            file_rows = (parts for parts in file_rows if (file_row_ids(parts) or (0, None))[1] in dirty)
+        spill = JoinSpill(self.store.path('join', 'spill'))
+        new_languages = {}
+        for shard_torrents, shard_index in iter_joined_shards(file_rows, subtitle_files, torrent_metadata, self.workers):
+            spill.add_shard(shard_torrents, torrent_metadata)
+            new_languages.update(dict.fromkeys(shard_index))
+        spill.flush()
+
+        print(f"📊 Found {len(spill)} torrents with subtitles")
+        return {
+            'incremental': bool(previous), 'torrents': len(spill), 'languages': list(new_languages),
+            'watermarks': {
+                'torrents': torrent_metadata.ids[-1] if torrent_metadata else 0,
+                'files': max_file_id,
+                'attachments': self.store.marker('subtitles')['max_attachment_id']
+            }
+        }
+
+    def stage_pack(self):
+        # Final entries with packs, one spill bucket at a time in ID order
+        spill = JoinSpill(self.store.path('join', 'spill'), clear=False)
+        final_entries = iter_final_db(spill.load(bucket) for bucket in spill.buckets())
+        return {'torrents': write_entries(self.store.path('pack', ENTRIES_FILE), final_entries)}
+
+    def stage_write(self):
+        join = self.store.marker('join')
+        entries = read_entries(self.store.path('pack', ENTRIES_FILE))
+        if join['incremental']:
+            previous = BuildState.load(self.state_dir)
+            if not previous:
+                raise StageError("The build state the join stage compared against is gone, run with --from-stage join")
+            # Only the changed torrents, small enough to keep whole
+            final_db = dict(entries)
+            removed_ids = [t for t in self.store.load('join', 'dirty.pickle') if str(t) not in final_db]
+            languages = list(dict.fromkeys(previous.manifest['languages'] + join['languages']))
+            search_splits = update_search_index(final_db, removed_ids, previous.manifest['search_splits'])
+            chunks = update_pages(final_db, removed_ids, languages, previous.manifest['chunks'], search_splits)
+            written = len(final_db)
+            print(f"✅ GitHub Pages database updated: {len(final_db)} changed, {len(removed_ids)} removed torrents")
+        else:
+            # Chunks and search index are fed from the same ID-ordered stream
+            removed_ids = []
+            languages = join['languages']
+            old = BuildState.load(self.state_dir)
+            pages = PagesWriter(old.manifest['chunks'] if old else ())
+            search_index = SearchIndexWriter()
+            written = 0
+            for tid, entry in entries:
+                pages.add(tid, entry)
+                search_index.add(tid, entry)
+                written += 1
+            search_splits = search_index.finish()
+            chunks = pages.finish(languages, search_splits)
+            print(f"✅ GitHub Pages database built: {written} torrents, {len(languages)} languages")
+        return {'chunks': chunks, 'languages': languages, 'search_splits': search_splits, 'removed_ids': removed_ids,
+                'torrents': written}
+
+    def stage_upload(self):
+        join = self.store.marker('join')
+        write = self.store.marker('write')
+        sync = TursoSync(full_sync=not join['incremental'], total=self.store.marker('pack')['torrents'],
+                         **self.upload_options)
+        added = 0
+        for tid, entry in read_entries(self.store.path('pack', ENTRIES_FILE)):
+            sync.add(int(tid), entry)
+            added += 1
+        uploaded = sync.finish(write['removed_ids'])
+        pending = sorted(sync.ids) + write['removed_ids'] if uploaded is False else []
+
+        BuildState({
+            'version': 1, 'built_at': int(time.time()), 'chunk_size': CHUNK_SIZE,
+            'watermarks': join['watermarks'], 'languages': write['languages'], 'chunks': write['chunks'],
+            'search_format': SEARCH_FORMAT, 'search_splits': write['search_splits'], 'pending_upload': pending
+        }, DigestTable.load(self.store.path('join', BuildState.FILES)),
+           DigestTable.load(self.store.path('join', BuildState.TORRENTS))).save(self.state_dir)
+        return {'uploaded': uploaded, 'pending': len(pending), 'torrents': added}
+
+def download_and_process(base_url=DEFAULT_DUMP_BASE_URL, cache_dir='data/dumps', fetch_workers=4, retries=3,
+                         force=False, workers=1, incremental=False, state_dir='data/build_state',
+                         upload_options=None, stage_dir=STAGE_DIR, from_stage=None, only_stage=None,
+                         keep_stages=False, report_path=REPORT_PATH, profile_stage=None):
+    """
+    Fetch the dumps and run the build stages after it. An unfinished build of
+    the same dumps resumes after its last finished stage; from_stage discards
+    the checkpoints from that stage on, and only_stage re-runs one stage from
+    the checkpoints before it. Intermediate checkpoints are pruned once the
+    build finishes unless keep_stages is set. Every run, finished or not,
+    leaves its BuildTelemetry report at report_path. Returns the run's
+    status: finished, skipped or failed.
+    """
+    telemetry = BuildTelemetry(report_path, profile_stage)
+    telemetry.report.update({'workers': workers, 'incremental': incremental, 'from_stage': from_stage,
+                             'only_stage': only_stage})
+    status = 'failed'
+    try:
+        status = run_build(telemetry, base_url, cache_dir, fetch_workers, retries, force, workers, incremental,
+                           state_dir, upload_options, stage_dir, from_stage, only_stage, keep_stages)
+    finally:
+        telemetry.finish(status)
+        telemetry.save()
+    return status
+
+def run_build(telemetry, base_url, cache_dir, fetch_workers, retries, force, workers, incremental, state_dir,
+              upload_options, stage_dir, from_stage, only_stage, keep_stages):
+    """download_and_process without the report handling. Returns the run's status: finished, skipped or failed."""
+    store = StageStore(stage_dir)
+    fetched = store.marker('fetch')
+    rerun = only_stage or from_stage
+    if rerun in (None, 'fetch'):
+        print("📥 Downloading AnimeTosho database...")
+        try:
+            with telemetry.stage('fetch') as record:
+                dump_paths, changed = fetch_dumps(base_url, cache_dir, fetch_workers, retries)
+                record['dumps_changed'] = changed
+                record['bytes_downloaded'] = sum(os.path.getsize(dump_cache_paths(cache_dir, name)[0])
+                                                 for name in changed)
+        except DumpError as e:
+            print(f"❌ {e}")
+            return 'failed'
+        print(f"✅ Stage fetch finished: {telemetry.summary(record)}, "
+              f"{record['bytes_downloaded'] / 1024 / 1024:.1f}MB downloaded")
+        fingerprint = dump_fingerprint(cache_dir, incremental)
+        if force or from_stage or (fetched['fingerprint'] != fingerprint if fetched else changed):
+            store.start('fetch')
+            store.finish('fetch', {'fingerprint': fingerprint, 'paths': dump_paths})
+        elif not fetched:
+            print("✅ All dumps unchanged upstream (304), skipping rebuild")
+            return 'skipped'
+        elif store.finished():
+            print("✅ Dumps unchanged since the last finished build, skipping rebuild")
+            return 'skipped'
+        if only_stage:
+            return 'finished'
+        stages = BUILD_STAGES[BUILD_STAGES.index(store.next_stage()):]
+        if stages[0] != BUILD_STAGES[1]:
+            print(f"⏭️ Resuming the unfinished build at stage {stages[0]}")
+            telemetry.report['resumed_at'] = stages[0]
+    elif fetched:
+        dump_paths = fetched['paths']
+        stages = [only_stage] if only_stage else BUILD_STAGES[BUILD_STAGES.index(from_stage):]
+    else:
+        print("❌ No fetched dumps checkpointed yet, run the fetch stage first")
+        return 'failed'
+
+    build = StagedBuild(store, dump_paths, workers, incremental, state_dir, upload_options, telemetry)
+    try:
+        build.run(stages)
+    except StageError as e:
+        print(f"❌ {e}")
+        return 'failed'
+    if store.finished() and not keep_stages:
+        store.prune()
+    return 'finished'
+
+TURSO_VERSION = '2.3_turso'
+REMOTE_SCHEMES = ('libsql://', 'https://', 'http://', 'wss://', 'ws://')
+
+TORRENT_COLUMNS = ('id', 'name', 'languages', 'episodes_available', 'total_size', 'anidb_id',
+                   'torrent_files', 'build_timestamp', 'version', 'content_hash')
+SUBTITLE_COLUMNS = ('torrent_id', 'filename', 'language', 'episode_number', 'size', 'is_pack',
+                    'pack_url_type', 'pack_name', 'afid', 'afids', 'target_episode', 'download_url',
+                    'range_end')
+SEARCH_COLUMNS = ('rowid', 'name', 'title')
+LANGUAGE_COLUMNS = ('torrent_id', 'language')
+COVERAGE_COLUMNS = ('torrent_id', 'season', 'episode')
+# Lookup tables derived from each torrent's rows and rewritten with them:
+# table -> (torrent id column, columns)
+DERIVED_TABLES = {
+    'torrent_search': ('rowid', SEARCH_COLUMNS),
+    'torrent_languages': ('torrent_id', LANGUAGE_COLUMNS),
+    'episode_coverage': ('torrent_id', COVERAGE_COLUMNS),
+}
+# Longest episode range expanded into episode_coverage
+MAX_RANGE_EPISODES = 2000
+
+# SQLite's default limit on bound parameters per statement
+SQLITE_MAX_VARIABLES = 32766
+MAX_ID = 2 ** 63 - 1
+UPLOAD_BATCH_BYTES = 512 * 1024
+UPLOAD_IN_FLIGHT = 4
+
+def connect_turso(url, token=None):
+    """libsql connection for a remote TURSO URL, sqlite3 for a local file standing in for it"""
+    if url.startswith(REMOTE_SCHEMES):
         import libsql_experimental as libsql
-        import time
+        return libsql.connect(url, auth_token=token)
+    import sqlite3
+    return sqlite3.connect(url[len('file:'):] if url.startswith('file:') else url, timeout=60,
+                           check_same_thread=False)
+
+def ensure_schema(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS torrents (
+        id INTEGER PRIMARY KEY, name TEXT, languages TEXT, 
+        episodes_available TEXT, total_size INTEGER, anidb_id INTEGER,
+        torrent_files TEXT, build_timestamp INTEGER, version TEXT)''')
+    
+    conn.execute('''CREATE TABLE IF NOT EXISTS subtitle_files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, torrent_id INTEGER,
+        filename TEXT, language TEXT, episode_number INTEGER, size INTEGER,
+        is_pack BOOLEAN, pack_url_type TEXT, pack_name TEXT, afid INTEGER,
+        afids TEXT, target_episode INTEGER, download_url TEXT)''')
+    
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_torrent_name ON torrents(name)')
+    ensure_unique_subtitles(conn)
+    conn.execute('CREATE TABLE IF NOT EXISTS build_meta (key TEXT PRIMARY KEY, value TEXT)')
+    add_column_if_missing(conn, 'torrents', 'content_hash', 'TEXT')
+    add_column_if_missing(conn, 'subtitle_files', 'range_end', 'INTEGER')
+
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()}
+    # Trigram full-text index over names and normalized titles for /api/search,
+    # rowid is the torrent id
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS torrent_search USING fts5(name, title, tokenize='trigram')")
+    # One row per torrent language, so the API can filter languages in SQL
+    conn.execute('''CREATE TABLE IF NOT EXISTS torrent_languages (
+        torrent_id INTEGER, language TEXT, PRIMARY KEY (torrent_id, language)) WITHOUT ROWID''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_torrent_languages_language ON torrent_languages(language, torrent_id)')
+    # Every episode a torrent covers, with ranges expanded. Specials are season 0
+    conn.execute('CREATE TABLE IF NOT EXISTS episode_coverage (torrent_id INTEGER, season INTEGER, episode INTEGER)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_episode_coverage_episode ON episode_coverage(episode, torrent_id)')
+    # Lets the API check one torrent's coverage of an episode; replaces the
+    # torrent_id-only index, which it covers
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_episode_coverage_torrent_episode ON episode_coverage(torrent_id, episode)')
+    conn.execute('DROP INDEX IF EXISTS idx_episode_coverage_torrent')
+    conn.commit()
+    missing = [table for table in DERIVED_TABLES if table not in existing]
+    if missing and 'torrents' in existing:
+        backfill_derived_tables(conn, missing)
+
+# Torrent IDs covered by one duplicate cleanup statement
+DEDUPE_BATCH_IDS = 20000
+
+def delete_duplicate_subtitles(conn, batch_ids=DEDUPE_BATCH_IDS):
+    """
+    Keep the first row (lowest id) of every (torrent_id, filename) in
+    subtitle_files and delete the others, one torrent ID range per statement
+    and transaction. Returns the number of rows deleted.
+    """
+    low, high = conn.execute('SELECT MIN(torrent_id), MAX(torrent_id) FROM subtitle_files').fetchone()
+    if low is None:
+        return 0
+    deleted = 0
+    for start in range(low, high + 1, batch_ids):
+        end = start + batch_ids - 1
+        cursor = conn.execute('''DELETE FROM subtitle_files WHERE torrent_id BETWEEN ? AND ? AND id NOT IN (
+            SELECT MIN(id) FROM subtitle_files WHERE torrent_id BETWEEN ? AND ? GROUP BY torrent_id, filename)''',
+            (start, end, start, end))
+        conn.commit()
+        deleted += max(cursor.rowcount, 0)
+        pct = (min(end, high) - low + 1) / (high - low + 1) * 100
+        print(f"  [{pct:5.1f}%] Checked torrents up to {min(end, high):,}, deleted {deleted:,} duplicates")
+        sys.stdout.flush()
+    return deleted
+
+def ensure_unique_subtitles(conn):
+    """
+    Migration: give subtitle_files a unique (torrent_id, filename) index,
+    deleting the duplicate rows that would stop it from being created.
+    Returns the number of rows deleted; none once the index exists.
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_subtitle_torrent_filename'").fetchone():
+        return 0
+    print("🔄 Removing duplicate subtitle files before adding the unique index...")
+    deleted = delete_duplicate_subtitles(conn)
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_subtitle_torrent_filename ON subtitle_files(torrent_id, filename)')
+    # Lookups by torrent_id use the unique index from now on
+    conn.execute('DROP INDEX IF EXISTS idx_subtitle_torrent')
+    conn.commit()
+    print(f"✅ subtitle_files is now unique per torrent and filename ({deleted:,} duplicates deleted)")
+    return deleted
+
+def backfill_derived_tables(conn, tables, page_size=5000):
+    """Fill lookup tables added after torrents were uploaded"""
+    last_id = -MAX_ID
+    indexed = 0
+    while True:
+        torrents = conn.execute(f"SELECT {', '.join(TORRENT_COLUMNS)} FROM torrents WHERE id > ? ORDER BY id LIMIT ?",
+                                (last_id, page_size)).fetchall()
+        if not torrents:
+            break
+        last_id = torrents[-1][0]
+        subtitles = defaultdict(list)
+        for row in conn.execute(f"SELECT {', '.join(SUBTITLE_COLUMNS)} FROM subtitle_files WHERE torrent_id BETWEEN ? AND ? ORDER BY id",
+                                (torrents[0][0], last_id)).fetchall():
+            subtitles[row[0]].append(row)
+        rows = defaultdict(list)
+        for torrent in torrents:
+            for table, table_rows in derived_rows(torrent, subtitles[torrent[0]]).items():
+                rows[table].extend(table_rows)
+        for table in tables:
+            for sql, params in multi_row_statements('INSERT', table, DERIVED_TABLES[table][1], rows[table]):
+                conn.execute(sql, params)
+        conn.commit()
+        indexed += len(torrents)
+    if indexed:
+        print(f"📊 Filled {', '.join(tables)} for {indexed:,} existing torrents")
+
+_TITLE_TAG_RE = re.compile(r'\[[^\]]*\]|\([^)]*\)|\{[^}]*\}|【[^】]*】')
+_TITLE_EXTENSION_RE = re.compile(r'\.(?:mkv|mp4|avi|ts|webm)$', re.IGNORECASE)
+_TITLE_SEPARATOR_RE = re.compile(r'[\s_.]+')
+
+def normalize_title(name):
+    """Torrent name without group tags, bracketed release info, extension and separators"""
+    title = _TITLE_EXTENSION_RE.sub('', name or '')
+    title = _TITLE_TAG_RE.sub(' ', title)
+    return _TITLE_SEPARATOR_RE.sub(' ', title).strip().lower()
+
+def derived_rows(torrent, subtitles):
+    """Rows of every DERIVED_TABLES table for one torrents row and its subtitle_files rows"""
+    torrent_id, name, languages = torrent[0], torrent[1] or '', torrent[2]
+    return {
+        'torrent_search': [(torrent_id, name, normalize_title(name))],
+        'torrent_languages': [(torrent_id, lang) for lang in dict.fromkeys(json.loads(languages or '[]'))],
+        'episode_coverage': episode_coverage_rows(torrent_id, name, [row[1] for row in subtitles]),
+    }
+
+def episode_coverage_rows(torrent_id, name, filenames):
+    """
+    (torrent_id, season, episode) for every episode in the subtitle filenames,
+    plus an episode range in the torrent name itself ("01-12" batches). Ranges
+    are expanded one row per episode and specials get season 0.
+    """
+    covered = {}
+    # A lone number in the torrent name is no better than its files' episodes
+    name_episode = extract_episode_number(name or '')
+    parsed = [name_episode] if name_episode[1] else []
+    parsed.extend(extract_episode_number(filename or '') for filename in filenames)
+    for episode, is_range, range_end, season, is_special in parsed:
+        if episode is None:
+            continue
+        if is_special:
+            season = 0
+        last = min(range_end, episode + MAX_RANGE_EPISODES - 1) if is_range else episode
+        for covered_episode in range(episode, last + 1):
+            covered[(torrent_id, season, covered_episode)] = None
+    return list(covered)
+
+def add_column_if_missing(conn, table, column, declaration):
+    columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()}
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+
+def torrent_row(torrent_id, data, build_timestamp, subtitles):
+    """torrents row, ending with a hash over everything uploaded for the torrent but the timestamp"""
+    row = (
+        int(torrent_id), data.get('name', ''), json.dumps(data.get('languages', [])),
+        json.dumps(data.get('episodes_available', [])), data.get('total_size', 0), data.get('anidb_id', 0),
+        json.dumps(data.get('torrent_files', []))
+    )
+    payload = json.dumps([row, TURSO_VERSION, subtitles], separators=(',', ':'))
+    return row + (build_timestamp, TURSO_VERSION, hashlib.sha1(payload.encode()).hexdigest())
+
+def subtitle_rows(torrent_id, data):
+    """subtitle_files rows of a torrent, one per filename like the unique index requires; the first one wins"""
+    rows = []
+    filenames = set()
+    for sf in data.get('subtitle_files', []):
+        filename = sf.get('filename', '')
+        if filename in filenames:
+            continue
+        filenames.add(filename)
+        afids = sf.get('afids', [])
+        afid = afids[0] if afids else None
+        
+        if sf.get('pack_url_type') == 'torattachpk':
+            download_url = f"https://storage.animetosho.org/torattachpk/{torrent_id}/{urllib.parse.quote(sf.get('pack_name', ''))}_attachments.7z"
+        elif afid:
+            download_url = f"https://storage.animetosho.org/attach/{afid:08x}/file.xz"
+        else:
+            download_url = None
         
+        langs = sf.get('languages', [])
+        sizes = sf.get('sizes', [])
+        rows.append((
+            int(torrent_id), filename, langs[0] if langs else None,
+            sf.get('episode_number'), sizes[0] if sizes else None, 1 if sf.get('is_pack', False) else 0,
+            sf.get('pack_url_type') or None, sf.get('pack_name') or None, afid or None,
+            json.dumps(afids), sf.get('target_episode'), download_url, sf.get('range_end')
+        ))
+    return rows
+
+def row_bytes(row):
+    """Rough wire size of a parameter row, good enough for batch sizing"""
+    return sum(len(v) if isinstance(v, str) else 8 for v in row)
+
+def delete_statements(table, column, ids):
+    for i in range(0, len(ids), SQLITE_MAX_VARIABLES):
+        chunk = ids[i:i + SQLITE_MAX_VARIABLES]
+        yield f"DELETE FROM {table} WHERE {column} IN ({', '.join('?' * len(chunk))})", chunk
+
+def multi_row_statements(verb, table, columns, rows):
+    """Split rows into multi-row VALUES statements that stay under the parameter limit"""
+    placeholders = '(' + ', '.join('?' * len(columns)) + ')'
+    per_statement = SQLITE_MAX_VARIABLES // len(columns)
+    for i in range(0, len(rows), per_statement):
+        chunk = rows[i:i + per_statement]
+        sql = f"{verb} INTO {table} ({', '.join(columns)}) VALUES " + ', '.join([placeholders] * len(chunk))
+        yield sql, [value for row in chunk for value in row]
+
+class UploadBatch:
+    def __init__(self):
+        self.clear_ids = []
+        self.delete_ids = []
+        self.torrents = []
+        self.subtitles = []
+        self.derived = {table: [] for table in DERIVED_TABLES}
+        self.size = 0
+
+    def __len__(self):
+        return len(self.torrents) + len(self.subtitles) + len(self.delete_ids)
+
+    def statements(self):
+        torrent_ids = [row[0] for row in self.torrents]
+        yield from delete_statements('subtitle_files', 'torrent_id', self.clear_ids + self.delete_ids)
+        for table, (column, _) in DERIVED_TABLES.items():
+            yield from delete_statements(table, column, torrent_ids + self.delete_ids)
+        yield from delete_statements('torrents', 'id', self.delete_ids)
+        yield from multi_row_statements('INSERT OR REPLACE', 'torrents', TORRENT_COLUMNS, self.torrents)
+        yield from multi_row_statements('INSERT', 'subtitle_files', SUBTITLE_COLUMNS, self.subtitles)
+        for table, (_, columns) in DERIVED_TABLES.items():
+            yield from multi_row_statements('INSERT', table, columns, self.derived[table])
+
+class BulkLoader:
+    """
+    Parameterized bulk writer for the TURSO tables. Rows are grouped into
+    batches of roughly batch_bytes, each batch is one transaction of multi-row
+    INSERTs, and up to in_flight batches run at once on their own connections.
+    """
+    def __init__(self, connect, batch_bytes=UPLOAD_BATCH_BYTES, in_flight=UPLOAD_IN_FLIGHT):
+        self.connect = connect
+        self.batch_bytes = batch_bytes
+        self.in_flight = max(1, in_flight)
+        self.pool = ThreadPoolExecutor(max_workers=self.in_flight)
+        self.pending = deque()
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.batch = UploadBatch()
+        self.rows = 0
+        self.bytes = 0
+        self.started = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(flush=exc_type is None)
+
+    def close(self, flush=True):
+        """Wait for the remaining batches (after writing the current one if flush) and release the connections"""
+        try:
+            if flush:
+                self.flush()
+                while self.pending:
+                    self.pending.popleft().result()
+        finally:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            for conn in self.connections:
+                conn.close()
+
+    def add_torrent(self, torrent, subtitles, replace=False):
+        batch = self.batch
+        if replace:
+            batch.clear_ids.append(torrent[0])
+        batch.torrents.append(torrent)
+        batch.subtitles.extend(subtitles)
+        batch.size += row_bytes(torrent) + sum(row_bytes(row) for row in subtitles)
+        for table, rows in derived_rows(torrent, subtitles).items():
+            batch.derived[table].extend(rows)
+            batch.size += sum(row_bytes(row) for row in rows)
+        if batch.size >= self.batch_bytes:
+            self.flush()
+
+    def delete_torrents(self, torrent_ids):
+        for torrent_id in torrent_ids:
+            self.batch.delete_ids.append(int(torrent_id))
+            self.batch.size += 8
+            if self.batch.size >= self.batch_bytes:
+                self.flush()
+
+    def flush(self):
+        if not len(self.batch):
+            return
+        self.pending.append(self.pool.submit(self._write, self.batch))
+        self.batch = UploadBatch()
+        # Back-pressure: never queue more than in_flight batches
+        while len(self.pending) >= self.in_flight:
+            self.pending.popleft().result()
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = self.connect()
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def _write(self, batch):
+        conn = self._connection()
+        try:
+            for sql, params in batch.statements():
+                conn.execute(sql, params)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        with self.lock:
+            self.rows += len(batch)
+            self.bytes += batch.size
+
+    def rate(self):
+        return self.rows / max(time.time() - self.started, 1e-9)
+
+# Torrents compared against TURSO per round trip
+SYNC_WINDOW = 2000
+
+class TursoSync:
+    """
+    Diff-sync torrents and their subtitle files into TURSO, fed one torrent at
+    a time in ascending ID order. Each torrent row carries a content hash.
+    Hashes are compared window by window, and only new or changed torrents are
+    rewritten. With full_sync, remote torrents missing from the build are
+    deleted as well; incremental builds feed only their changed torrents and
+    pass removed_ids to finish() instead.
+    TURSO_DATABASE_URL may also be a local SQLite file standing in for TURSO.
+    A failure stops the sync but not the build; finish() reports it.
+    """
+    def __init__(self, full_sync=True, total=None, batch_bytes=UPLOAD_BATCH_BYTES, in_flight=UPLOAD_IN_FLIGHT):
+        print("🔄 Syncing TURSO Database (content-hash diff)...")
+        self.full_sync = full_sync
+        self.total = total
+        self.ids = array('q')
+        self.window = []
+        self.low = -MAX_ID
+        self.upserted = 0
+        self.unchanged = 0
+        self.deleted = 0
+        self.build_timestamp = int(time.time())
+        self.last_print_time = time.time()
+        self.conn = None
+        self.loader = None
+        self.failed = False
+
         turso_url = os.getenv('TURSO_DATABASE_URL')
         turso_token = os.getenv('TURSO_AUTH_TOKEN')
-        
-        if not turso_url or not turso_token:
+        self.configured = bool(turso_url) and not (turso_url.startswith(REMOTE_SCHEMES) and not turso_token)
+        if not self.configured:
             print("⚠️ TURSO credentials not set, skipping TURSO upload")
-        else:
-            conn = libsql.connect(turso_url, auth_token=turso_token)
-            
-            # Create schema
-            conn.execute('''CREATE TABLE IF NOT EXISTS torrents (
-                id INTEGER PRIMARY KEY, name TEXT, languages TEXT, 
-                episodes_available TEXT, total_size INTEGER, anidb_id INTEGER,
-                torrent_files TEXT, build_timestamp INTEGER, version TEXT)''')
-            
-            conn.execute('''CREATE TABLE IF NOT EXISTS subtitle_files (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, torrent_id INTEGER,
-                filename TEXT, language TEXT, episode_number INTEGER, size INTEGER,
-                is_pack BOOLEAN, pack_url_type TEXT, pack_name TEXT, afid INTEGER,
-                afids TEXT, target_episode INTEGER, download_url TEXT)''')
-            
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_torrent_name ON torrents(name)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_subtitle_torrent ON subtitle_files(torrent_id)')
-            
-            # Get existing torrent IDs to avoid re-uploading (RESUME SUPPORT)
-            print(f"🔍 Checking existing torrents...")
-            existing_ids = set()
+            return
+
+        try:
+            self.conn = connect_turso(turso_url, turso_token)
+            ensure_schema(self.conn)
+            self.loader = BulkLoader(lambda: connect_turso(turso_url, turso_token), batch_bytes, in_flight)
+        except Exception as e:
+            self.fail(e)
+            return
+        total_text = f"{total:,} " if total is not None else ''
+        print(f"🔄 Comparing {total_text}torrents ({batch_bytes // 1024}KB batches, {in_flight} in flight)...")
+
+    @property
+    def active(self):
+        return self.configured and not self.failed
+
+    def fail(self, error):
+        print(f"❌ TURSO upload failed: {error}")
+        self.failed = True
+        if self.loader:
             try:
-                result = conn.execute("SELECT id FROM torrents").fetchall()
-                existing_ids = {row[0] for row in result}
-                print(f"   Found {len(existing_ids):,} existing, will skip them")
-            except:
-                print("   Starting fresh")
-            
-            print(f"🔄 Uploading {len(final_db):,} torrents (BATCH MODE, RESUME FROM {len(existing_ids):,})...")
-            uploaded = 0
-            skipped = 0
-            processed = 0
-            
-            # Build SQL batch string instead of using executemany
-            batch_sql = ["BEGIN"]
-            batch_count = 0
-            BATCH_SIZE = 5000  # Larger batches for batch API
-            last_print_time = time.time()
+                self.loader.close(flush=False)
+            except Exception:
+                pass
+        if self.conn:
+            self.conn.close()
+
+    def add(self, torrent_id, data):
+        self.ids.append(torrent_id)
+        if not self.active:
+            return
+        # A full window is synced once the next torrent shows it was not the last
+        if len(self.window) >= SYNC_WINDOW:
+            self.sync_window(last=False)
+        self.window.append((torrent_id, data))
+
+    def sync_window(self, last):
+        window, self.window = self.window, []
+        if not window or not self.active:
+            return
+        try:
+            window_ids = [torrent_id for torrent_id, _ in window]
+            if self.full_sync:
+                # Contiguous ranges, so remote IDs between build IDs show up too
+                high = MAX_ID if last else window_ids[-1]
+                remote = dict(self.conn.execute("SELECT id, content_hash FROM torrents WHERE id BETWEEN ? AND ?",
+                                                (self.low, high)).fetchall())
+                self.low = high + 1
+            else:
+                marks = ', '.join('?' * len(window_ids))
+                remote = dict(self.conn.execute(f"SELECT id, content_hash FROM torrents WHERE id IN ({marks})",
+                                                window_ids).fetchall())
             
-            for torrent_id, data in final_db.items():
-                processed += 1
-                # SKIP if already exists
-                if int(torrent_id) in existing_ids:
-                    skipped += 1
+            for torrent_id, data in window:
+                subtitles = subtitle_rows(torrent_id, data)
+                row = torrent_row(torrent_id, data, self.build_timestamp, subtitles)
+                if remote.get(torrent_id) == row[-1]:
+                    self.unchanged += 1
                     continue
-                
-                # Build INSERT statements as SQL strings
-                name = data.get('name', '').replace("'", "''")
-                langs = json.dumps(data.get('languages', [])).replace("'", "''")
-                eps = json.dumps(data.get('episodes_available', [])).replace("'", "''")
-                tfiles = json.dumps(data.get('torrent_files', [])).replace("'", "''")
-                
-                batch_sql.append(f"""INSERT INTO torrents (id, name, languages, episodes_available, total_size, anidb_id, torrent_files, build_timestamp, version) 
-                    VALUES ({int(torrent_id)}, '{name}', '{langs}', '{eps}', {data.get('total_size', 0)}, {data.get('anidb_id', 0)}, '{tfiles}', {int(time.time())}, '2.3_turso')""")
-                
-                # Add subtitle files
-                for sf in data.get('subtitle_files', []):
-                    afids = sf.get('afids', [])
-                    afid = afids[0] if afids else None
-                    
-                    if sf.get('pack_url_type') == 'torattachpk':
-                        download_url = f"https://storage.animetosho.org/torattachpk/{torrent_id}/{urllib.parse.quote(sf.get('pack_name', ''))}_attachments.7z"
-                    elif afid:
-                        download_url = f"https://storage.animetosho.org/attach/{afid:08x}/file.xz"
-                    else:
-                        download_url = None
-                    
-                    filename = sf.get('filename', '').replace("'", "''")
-                    langs = sf.get('languages', [])
-                    lang = langs[0].replace("'", "''") if langs else 'NULL'
-                    sizes = sf.get('sizes', [])
-                    size = sizes[0] if sizes else 'NULL'
-                    ep = sf.get('episode_number')
-                    ep_str = str(ep) if ep is not None else 'NULL'
-                    is_pack = 1 if sf.get('is_pack', False) else 0
-                    pack_type = sf.get('pack_url_type', '')
-                    pack_type_str = f"'{pack_type}'" if pack_type else 'NULL'
-                    pack_name = sf.get('pack_name', '').replace("'", "''")
-                    pack_name_str = f"'{pack_name}'" if pack_name else 'NULL'
-                    afid_str = str(afid) if afid else 'NULL'
-                    afids_json = json.dumps(afids).replace("'", "''")
-                    target_ep = sf.get('target_episode')
-                    target_ep_str = str(target_ep) if target_ep is not None else 'NULL'
-                    url_str = f"'{download_url}'" if download_url else 'NULL'
-                    
-                    batch_sql.append(f"""INSERT INTO subtitle_files (torrent_id, filename, language, episode_number, size, is_pack, pack_url_type, pack_name, afid, afids, target_episode, download_url) 
-                        VALUES ({int(torrent_id)}, '{filename}', '{lang}', {ep_str}, {size}, {is_pack}, {pack_type_str}, {pack_name_str}, {afid_str}, '{afids_json}', {target_ep_str}, {url_str})""")
-                
-                uploaded += 1
-                batch_count += 1
-                
-                # Execute batch when full
-                if batch_count >= BATCH_SIZE:
-                    batch_sql.append("COMMIT")
-                    conn.executescript("; ".join(batch_sql))
-                    batch_sql = ["BEGIN"]
-                    batch_count = 0
-                    
-                    # Print progress every 60 seconds
-                    if time.time() - last_print_time > 60:
-                        print(f"   Progress: {processed:,}/{len(final_db):,} ({processed/len(final_db)*100:.1f}%) | Uploaded: {uploaded:,} | Skipped: {skipped:,}")
-                        last_print_time = time.time()
+                self.loader.add_torrent(row, subtitles, replace=torrent_id in remote)
+                self.upserted += 1
             
-            # Flush remaining batch
-            if batch_count > 0:
-                batch_sql.append("COMMIT")
-                conn.executescript("; ".join(batch_sql))
-            conn.close()
-            print(f"✅ TURSO upload complete: {uploaded:,} torrents")
+            if self.full_sync:
+                build_ids = set(window_ids)
+                stale = [torrent_id for torrent_id in remote if torrent_id not in build_ids]
+                self.loader.delete_torrents(stale)
+                self.deleted += len(stale)
+        except Exception as e:
+            self.fail(e)
+            return
+        
+        # Print progress every 60 seconds
+        if time.time() - self.last_print_time > 60:
+            processed = self.upserted + self.unchanged
+            progress = f"{processed:,}/{self.total:,} ({processed / max(self.total, 1) * 100:.1f}%)" if self.total else f"{processed:,}"
+            print(f"   Progress: {progress} | Upserted: {self.upserted:,} | Unchanged: {self.unchanged:,} | Deleted: {self.deleted:,} | {self.loader.rate():,.0f} rows/sec")
+            self.last_print_time = time.time()
+
+    def finish(self, removed_ids=()):
+        """Sync the last window and delete removed_ids. Returns True on success, False on failure and None when TURSO is not configured."""
+        if not self.configured:
+            return None
+        self.sync_window(last=True)
+        if not self.active:
+            return False
+        try:
+            # Torrents that lost all their subtitles upstream
+            self.loader.delete_torrents(removed_ids)
+            self.deleted += len(removed_ids)
+            self.loader.close()
             
-    except Exception as e:
-        print(f"❌ TURSO upload failed: {e}")
+            # The API keys its response cache on this, so only bump it when data changed
+            if self.upserted or self.deleted:
+                self.conn.execute("INSERT OR REPLACE INTO build_meta (key, value) VALUES ('build_version', ?)",
+                                  (f'{TURSO_VERSION}:{self.build_timestamp}',))
+                self.conn.commit()
+            self.conn.close()
+        except Exception as e:
+            self.fail(e)
+            return False
+        
+        elapsed = time.time() - self.loader.started
+        print(f"✅ TURSO sync complete: {self.upserted:,} upserted, {self.unchanged:,} unchanged, {self.deleted:,} deleted")
+        print(f"📊 {self.loader.rows:,} rows ({self.loader.bytes / 1024 / 1024:.1f}MB) in {elapsed:.1f}s, {self.loader.rate():,.0f} rows/sec")
+        return True
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the AnimeTosho subtitle database')
+    parser.add_argument('--base-url', default=DEFAULT_DUMP_BASE_URL,
+                        help='Base URL of the *-latest.txt.xz dumps (env: ANIMETOSHO_DUMP_URL)')
+    parser.add_argument('--cache-dir', default='data/dumps', help='Dump cache directory, reused between runs')
+    parser.add_argument('--fetch-workers', type=int, default=4, help='Parallel dump downloads')
+    parser.add_argument('--retries', type=int, default=3, help='Download attempts per dump')
+    parser.add_argument('--force', action='store_true', help='Rebuild from scratch, even if no dump changed upstream or an unfinished build could resume')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Processes used to join the files dump (1 = single process)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only reprocess torrents that changed since the last build')
+    parser.add_argument('--state-dir', default='data/build_state',
+                        help='Where the build manifest and row digests are kept')
+    parser.add_argument('--upload-batch-kb', type=int, default=UPLOAD_BATCH_BYTES // 1024,
+                        help='Approximate size of one TURSO upload transaction')
+    parser.add_argument('--upload-in-flight', type=int, default=UPLOAD_IN_FLIGHT,
+                        help='TURSO upload batches written concurrently')
+    parser.add_argument('--stage-dir', default=STAGE_DIR,
+                        help='Where stage checkpoints are kept; an unfinished build resumes from them')
+    stage_group = parser.add_mutually_exclusive_group()
+    stage_group.add_argument('--from-stage', choices=BUILD_STAGES,
+                             help='Discard the checkpoints from this stage on and rebuild from it')
+    stage_group.add_argument('--only-stage', choices=BUILD_STAGES,
+                             help='Re-run a single stage from the checkpoints before it')
+    parser.add_argument('--keep-stages', action='store_true',
+                        help='Keep intermediate checkpoints after a finished build, to re-run single stages')
+    parser.add_argument('--report', default=REPORT_PATH,
+                        help='Where to save the JSON report of per-stage time, rows, memory and parse failures')
+    parser.add_argument('--profile-stage', choices=BUILD_STAGES,
+                        help='Run this stage under cProfile and save its stats next to the report '
+                             '(join workers are not profiled, use --workers 1)')
+    args = parser.parse_args()
+
+    upload_options = {'batch_bytes': args.upload_batch_kb * 1024, 'in_flight': args.upload_in_flight}
+    status = download_and_process(args.base_url, args.cache_dir, args.fetch_workers, args.retries, args.force,
+                                  args.workers, args.incremental, args.state_dir, upload_options,
+                                  args.stage_dir, args.from_stage, args.only_stage, args.keep_stages, args.report,
+                                  args.profile_stage)
+    # A failed build fails the workflow step, as its report says
+    if status == 'failed':
+        sys.exit(1)
 
 if __name__ == '__main__':
-    download_and_process()
+    main()
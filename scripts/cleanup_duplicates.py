@@ -1,48 +1,15 @@
 #!/usr/bin/env python3
-import libsql_experimental as libsql
+# Delete duplicate (torrent_id, filename) rows from subtitle_files and add the
+# unique index that keeps them out. build_database.py runs the same migration
+# from ensure_schema; this runs it on its own.
 import os
+from build_database import connect_turso, ensure_unique_subtitles
 
-conn = libsql.connect(
-    os.getenv('TURSO_DATABASE_URL'),
-    auth_token=os.getenv('TURSO_AUTH_TOKEN')
-)
+conn = connect_turso(os.getenv('TURSO_DATABASE_URL'), os.getenv('TURSO_AUTH_TOKEN'))
 
-print('🔍 Finding torrents with duplicate subtitle files...')
-# Get torrents that have duplicates
-torrents_with_dupes = conn.execute('''
-    SELECT DISTINCT torrent_id
-    FROM subtitle_files
-    GROUP BY torrent_id, filename
-    HAVING COUNT(*) > 1
-''').fetchall()
-
-print(f'Found {len(torrents_with_dupes):,} torrents with duplicates')
-
-deleted = 0
-for i, (torrent_id,) in enumerate(torrents_with_dupes):
-    # For this torrent, find all duplicate groups
-    dupes = conn.execute('''
-        SELECT filename, MIN(id) as keep_id, GROUP_CONCAT(id) as all_ids
-        FROM subtitle_files
-        WHERE torrent_id = ?
-        GROUP BY filename
-        HAVING COUNT(*) > 1
-    ''', (torrent_id,)).fetchall()
-    
-    for filename, keep_id, all_ids_str in dupes:
-        all_ids = [int(x) for x in all_ids_str.split(',')]
-        delete_ids = [x for x in all_ids if x != keep_id]
-        
-        for del_id in delete_ids:
-            conn.execute('DELETE FROM subtitle_files WHERE id = ?', (del_id,))
-            deleted += 1
-    
-    if (i + 1) % 50 == 0:
-        conn.commit()
-        pct = (i + 1) / len(torrents_with_dupes) * 100
-        print(f'  [{pct:5.1f}%] Processed {i+1:,}/{len(torrents_with_dupes):,} torrents, deleted {deleted:,} duplicates')
-
-conn.commit()
+# Once the unique index exists there is nothing left to delete
+print('🔍 Deleting duplicate subtitle files...')
+deleted = ensure_unique_subtitles(conn)
 print(f'✅ Deleted {deleted:,} duplicate subtitle files')
 
 # Verify
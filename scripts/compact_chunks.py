@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Columnar encoding of the docs/subtitles_N.json chunks.
+
+A chunk is stored as two tables, one row per torrent and one row per subtitle
+file entry. Rows are grouped by shape (their keys, in order), and each group
+keeps one array per key instead of one object per row, so keys are written
+once per chunk and a key missing from a shape costs nothing. Decoding gives
+back exactly the entries that went in.
+
+    {"format": "columnar-2", "ids": [...],
+     "torrents": {"shapes": [[key, ...]], "shape": column, "groups": [{key: column}]},
+     "files": {...same...}}
+
+A column is one of:
+    [v, ...]                  plain values
+    {"c": v}                  the same value on every row
+    {"d": [v, ...], "i": col} dictionary of distinct values and an index column
+    {"n": col, "v": col}      lists flattened: per-row lengths and all items
+
+In the torrents table subtitle_files holds the torrent's number of file rows.
+Those rows follow each other in torrent order.
+
+This module only needs the standard library, so clients such as a Kodi addon
+can copy it as is. Use CompactChunk to read a chunk.
+"""
+
+import gzip
+import json
+from bisect import bisect_left
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FORMAT = 'columnar-2'
+
+def encode_column(values, dictionary=True):
+    keys = [json.dumps(value, separators=(',', ':')) for value in values]
+    distinct = {}
+    for key, value in zip(keys, values):
+        distinct.setdefault(key, (len(distinct), value))
+    if len(distinct) == 1:
+        return {'c': values[0]}
+    # Dictionary-encode when that at least halves the values written
+    if dictionary and len(distinct) * 2 <= len(values):
+        index = [distinct[key][0] for key in keys]
+        return {'d': [value for _, value in distinct.values()], 'i': encode_column(index, dictionary=False)}
+    if all(type(value) is list and not any(isinstance(item, (list, dict)) for item in value) for value in values):
+        return {'n': encode_column([len(value) for value in values]), 'v': encode_column([item for value in values for item in value])}
+    return values
+
+def column_reader(column, rows):
+    """row -> value for an encoded column of rows values"""
+    if isinstance(column, list):
+        return column.__getitem__
+    if 'c' in column:
+        value = column['c']
+        return lambda row: value
+    if 'd' in column:
+        dictionary, index = column['d'], column_reader(column['i'], rows)
+        return lambda row: dictionary[index(row)]
+    lengths = column_reader(column['n'], rows)
+    offsets = [0]
+    for row in range(rows):
+        offsets.append(offsets[-1] + lengths(row))
+    items = column_reader(column['v'], offsets[-1])
+    return lambda row: [items(i) for i in range(offsets[row], offsets[row + 1])]
+
+def encode_table(rows):
+    shapes = {}
+    shape_column = []
+    groups = []
+    for row in rows:
+        keys = tuple(row)
+        shape = shapes.get(keys)
+        if shape is None:
+            shape = shapes[keys] = len(shapes)
+            groups.append({key: [] for key in keys})
+        shape_column.append(shape)
+        group = groups[shape]
+        for key, value in row.items():
+            group[key].append(value)
+    return {
+        'shapes': [list(keys) for keys in shapes],
+        'shape': encode_column(shape_column) if rows else [],
+        'groups': [{key: encode_column(values) for key, values in group.items()} for group in groups],
+    }
+
+def encode_chunk(chunk_data):
+    """Columnar form of a chunk: {torrent id: entry} with IDs in ascending order"""
+    torrents = []
+    files = []
+    for entry in chunk_data.values():
+        row = dict(entry)
+        subtitle_files = row.get('subtitle_files')
+        if subtitle_files is not None:
+            row['subtitle_files'] = len(subtitle_files)
+            files.extend(subtitle_files)
+        torrents.append(row)
+    return {
+        'format': FORMAT,
+        'ids': [int(tid) for tid in chunk_data],
+        'torrents': encode_table(torrents),
+        'files': encode_table(files),
+    }
+
+def compressed_payloads(payload):
+    """(suffix, bytes) for the pre-compressed siblings of a serialized chunk"""
+    yield '.gz', gzip.compress(payload, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield '.br', brotli.compress(payload, quality=11)
+
+class TableReader:
+    """Rows of an encoded table, with column readers built on first access"""
+
+    def __init__(self, table, rows):
+        self.table = table
+        self.rows = rows
+        self._positions = None
+        self._readers = None
+
+    def row(self, row):
+        if self._readers is None:
+            shape = column_reader(self.table['shape'], self.rows)
+            positions = []
+            seen = [0] * len(self.table['shapes'])
+            for r in range(self.rows):
+                s = shape(r)
+                positions.append((s, seen[s]))
+                seen[s] += 1
+            self._positions = positions
+            self._readers = [[(key, column_reader(group[key], count)) for key in keys]
+                             for keys, group, count in zip(self.table['shapes'], self.table['groups'], seen)]
+        shape, position = self._positions[row]
+        return {key: read(position) for key, read in self._readers[shape]}
+
+class CompactChunk:
+    """Lazy reader: torrents are rebuilt from the columns one at a time, on access"""
+
+    def __init__(self, data):
+        if data.get('format') != FORMAT:
+            raise ValueError(f"Unsupported chunk format: {data.get('format')!r}")
+        self.ids = data['ids']
+        self.torrents = TableReader(data['torrents'], len(self.ids))
+        self.files = data['files']
+        self._file_reader = None
+        self._file_offsets = None
+
+    @classmethod
+    def open(cls, path):
+        """Read a .json chunk or its .gz/.br sibling"""
+        with open(path, 'rb') as f:
+            payload = f.read()
+        if path.endswith('.gz'):
+            payload = gzip.decompress(payload)
+        elif path.endswith('.br'):
+            if brotli is None:
+                raise ImportError('brotli is required to read .br chunks')
+            payload = brotli.decompress(payload)
+        return cls(json.loads(payload))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, torrent_id):
+        return self._position(torrent_id) is not None
+
+    def __iter__(self):
+        return (str(torrent_id) for torrent_id in self.ids)
+
+    def __getitem__(self, torrent_id):
+        position = self._position(torrent_id)
+        if position is None:
+            raise KeyError(torrent_id)
+        return self._torrent(position)
+
+    def get(self, torrent_id, default=None):
+        position = self._position(torrent_id)
+        return default if position is None else self._torrent(position)
+
+    def items(self):
+        for position, torrent_id in enumerate(self.ids):
+            yield str(torrent_id), self._torrent(position)
+
+    def _position(self, torrent_id):
+        try:
+            torrent_id = int(torrent_id)
+        except (TypeError, ValueError):
+            return None
+        position = bisect_left(self.ids, torrent_id)
+        if position < len(self.ids) and self.ids[position] == torrent_id:
+            return position
+        return None
+
+    def _torrent(self, position):
+        entry = self.torrents.row(position)
+        if 'subtitle_files' in entry:
+            if self._file_offsets is None:
+                # Where each torrent's file rows start, computed once on first use
+                offsets = [0]
+                for row in range(len(self.ids)):
+                    offsets.append(offsets[-1] + (self.torrents.row(row).get('subtitle_files') or 0))
+                self._file_offsets = offsets
+                self._file_reader = TableReader(self.files, offsets[-1])
+            start, end = self._file_offsets[position], self._file_offsets[position + 1]
+            entry['subtitle_files'] = [self._file_reader.row(row) for row in range(start, end)]
+        return entry